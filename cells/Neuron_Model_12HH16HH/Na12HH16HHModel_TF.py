@@ -41,7 +41,8 @@ class Na12Model_TF:
                  node_na=1,
                  dend_K=0.025,
                  plots_folder='./Plots/', pfx='testprefix',
-                 update=True, fac=None, na12_scale=None):
+                 update=True, fac=None, na12_scale=None, variant_params=None):
+        self.model_kwargs = {k: v for k, v in locals().items() if k != 'self'}  # to rebuild the model in worker processes
 
         # K = 1 ##TF020624
         # node_na = 0.5 #(0.5 good value, default following newAIS) #1#100#90#80#70#60#50#40#30#20 #10
@@ -65,6 +66,7 @@ class Na12Model_TF:
                                  params_folder=params_folder,
                                  fac=fac,
                                  na12_scale=na12_scale,
+                                 variant_params=variant_params,
                                  )
 
         self.plot_folder = plots_folder
@@ -618,33 +620,17 @@ class Na12Model_TF:
         return axs
 
     def get_axonal_ks(self, start_Vm=-72, dt=0.1, rec_extra=False):
-        h.dt = dt
         self.dt = dt
-        h.finitialize(start_Vm)
-        timesteps = int(h.tstop / h.dt)
-
-        Vm = np.zeros(timesteps)
-        I = {}
-        I['Na'] = np.zeros(timesteps)
-        I['K'] = np.zeros(timesteps)
-        I['K31'] = np.zeros(timesteps)
-        I['KT'] = np.zeros(timesteps)
-        I['KCa'] = np.zeros(timesteps)
-        I['KP'] = np.zeros(timesteps)
-        stim = np.zeros(timesteps)
-        t = np.zeros(timesteps)
-
-        for i in range(timesteps):
-            Vm[i] = h.cell.soma[0].v
-            I['Na'][i] = self.l5mdl.ais(0.5).ina
-            I['K'][i] = self.l5mdl.ais(0.5).ik
-            I['K31'][i] = self.l5mdl.ais.gSKv3_1_SKv3_1
-            I['KP'][i] = self.l5mdl.ais.gK_Pst_K_Pst
-            I['KT'][i] = self.l5mdl.ais.gK_Tst_K_Tst
-            I['KCa'][i] = self.l5mdl.ais.gSK_E2_SK_E2
-            t[i] = i * h.dt / 1000
-            stim[i] = h.st.amp
-            h.fadvance()
+        ais = self.l5mdl.ais(0.5)
+        rec = self.l5mdl.run_spec({'soma': {'site': ('soma', 0, 0.5), 'vars': ['v']},
+                                   'ais': {'site': ais, 'vars': ['ina', 'ik', 'gSKv3_1_SKv3_1', 'gK_Pst_K_Pst',
+                                                                 'gK_Tst_K_Tst', 'gSK_E2_SK_E2']},
+                                   'st': {'site': h.st, 'vars': ['amp']}}, start_Vm=start_Vm, dt=dt)
+        Vm = rec['soma.v']
+        I = {'Na': rec['ais.ina'], 'K': rec['ais.ik'], 'K31': rec['ais.gSKv3_1_SKv3_1'],
+             'KT': rec['ais.gK_Tst_K_Tst'], 'KCa': rec['ais.gSK_E2_SK_E2'], 'KP': rec['ais.gK_Pst_K_Pst']}
+        t = rec.t('soma.v') / 1000
+        stim = rec['st.amp']
         return Vm, I, t, stim
 
     def plot_axonal_ks(self, stim_amp=0.5, dt=0.01, clr='black', plot_fn='step_axon_ks', axs=None, stim_dur=500):
@@ -683,9 +669,10 @@ class Na12Model_TF:
         return axs
 
     def plot_fi_curve(self, start, end, nruns, wt_data=None, ax1=None, fig=None,
-                      fn='ficurve'):  # start=0,end=0.6,nruns=14
+                      fn='ficurve', processes=None):  # start=0,end=0.6,nruns=14
+        # processes > 1: amplitudes run in parallel, each worker builds this model once (fi_engine.py)
         fis = get_fi_curve(self.l5mdl, start, end, nruns, dt=0.1, wt_data=wt_data, ax1=ax1, fig=fig,
-                           fn=f'{self.plot_folder}{fn}.pdf')
+                           fn=f'{self.plot_folder}{fn}.pdf', model_kwargs=self.model_kwargs, processes=processes)
         return fis
 
     def plot_volts_dvdt(self, stim_amp=0.5):
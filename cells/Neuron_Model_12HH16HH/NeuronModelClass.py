@@ -14,6 +14,7 @@ import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 from NrnHelper import *
+from recording import Recorder
 import gc
 
 
@@ -52,6 +53,7 @@ class NeuronModel:
                  gpas_all=1,
                  fac=None,
                  na12_scale=None,
+                 variant_params=None,  # dict of na12mut params (e.g. from variant_table); overrides na12mut_name file
                  #   morphology_index=0
                  ):
 
@@ -189,8 +191,11 @@ class NeuronModel:
             self.na12_p = update_mech_from_dict(self, p_fn_na12, self.na12wt_mech)  ###
             print(eval("h.psection()"))
             # print(f'using mut_file params {na12mut_name}')
-            self.na12_pmech = update_mech_from_dict(self, p_fn_na12_mech,
-                                                    self.na12mut_mech)  # update_mech_from_dict(mdl,dict_fn,mechs,input_dict = False) 2nd arg (dict) updates 3rd (mech) ###
+            if variant_params is not None:
+                self.na12_pmech = update_mech_from_dict(self, variant_params, self.na12mut_mech, input_dict=True)
+            else:
+                self.na12_pmech = update_mech_from_dict(self, p_fn_na12_mech,
+                                                        self.na12mut_mech)  # update_mech_from_dict(mdl,dict_fn,mechs,input_dict = False) 2nd arg (dict) updates 3rd (mech) ###
             print(eval("h.psection()"))
 
             # Updates gbar in na12 and na12mut mechs with value in nav12. Updates all gbars in all sections including all segments in AIS
@@ -923,91 +928,62 @@ class NeuronModel:
         h.finitialize(start_Vm)
         h.tstop = tstop
 
+    def extra_spec(self):
+        """Recording spec of the rec_extra voltages: AIS, apical nexus, distal dendrite, axon proper"""
+        nseg = int(self.h.L / 10) * 2 + 1  # create 19 segments from this axon section
+        ais_mid = 4 / nseg  # specify the middle of the AIS as 1/5 of this section
+        return {'ais': {'site': self.ais(ais_mid), 'vars': ['v']},
+                'nexus': {'site': self.nexus(0.5), 'vars': ['v']},
+                'dist_dend': {'site': self.dist_dend(0.5), 'vars': ['v']},
+                'axon': {'site': self.axon_proper(0.5), 'vars': ['v']}}
+
+    def run_spec(self, rec_spec, start_Vm=-72, dt=0.1, dtype=np.float64):
+        """Run a sweep of h.tstop ms recording rec_spec (see recording.py); the Recording is also kept in self.recording"""
+        self.recording = Recorder(rec_spec, h.cell).run(h.tstop, dt, start_Vm, dtype)
+        return self.recording
+
     def run_model2(self, stim_start=100, stim_dur=0.2, amp=0.3, dt=0.1,
-                   rec_extra=False):  # works in combinition with stim_start for working with physiological stimultion
+                   rec_extra=False, rec_spec=None):  # works in combinition with stim_start for working with physiological stimultion
         h.dt = dt
         h("st.del = " + str(stim_start))
         h("st.dur = " + str(stim_dur))
         h("st.amp = " + str(amp))
         timesteps = int(stim_dur / h.dt)  # changed from h.tstop to stim_dur
-        Vm = np.zeros(timesteps)
-        I = {}
-        I['Na'] = np.zeros(timesteps)
-        I['Ca'] = np.zeros(timesteps)
-        I['K'] = np.zeros(timesteps)
-        stim = np.zeros(timesteps)
-        t = np.zeros(timesteps)
+        spec = {'soma': {'site': ('soma', 0, 0.5), 'vars': ['v', 'ina', 'ica', 'ik']},
+                'st': {'site': h.st, 'vars': ['amp']}}
         if rec_extra:
-            extra_Vms = {}
-            extra_Vms['ais'] = np.zeros(timesteps)
-            extra_Vms['nexus'] = np.zeros(timesteps)
-            extra_Vms['dist_dend'] = np.zeros(timesteps)
-            extra_Vms['axon'] = np.zeros(timesteps)
-
-        for i in range(timesteps):
-            Vm[i] = h.cell.soma[0].v
-            I['Na'][i] = h.cell.soma[0](0.5).ina
-            I['Ca'][i] = h.cell.soma[0](0.5).ica
-            I['K'][i] = h.cell.soma[0](0.5).ik
-            stim[i] = h.st.amp
-            t[i] = (
-                               stim_start + i * h.dt) / 1000  # after each run_modl2 call, the stim_start is updated to the current time
-            if rec_extra:
-                nseg = int(self.h.L / 10) * 2 + 1  # create 19 segments from this axon section
-                ais_end = 10 / nseg  # specify the end of the AIS as halfway down this section
-                ais_mid = 4 / nseg  # specify the middle of the AIS as 1/5 of this section
-                extra_Vms['ais'][i] = self.ais(ais_mid).v
-                extra_Vms['nexus'][i] = self.nexus(0.5).v
-                extra_Vms['dist_dend'][i] = self.dist_dend(0.5).v
-                extra_Vms['axon'][i] = self.axon_proper(0.5).v
-            h.fadvance()
+            spec.update(self.extra_spec())
+        spec.update(rec_spec or {})
+        # continues from the current state (no finitialize), so probes are read before each step
+        self.recording = rec = Recorder(spec, h.cell).step(timesteps, dt)
+        Vm = rec['soma.v']
+        I = {'Na': rec['soma.ina'], 'Ca': rec['soma.ica'], 'K': rec['soma.ik']}
+        stim = rec['st.amp']
+        t = (stim_start + np.arange(timesteps) * dt) / 1000  # after each run_modl2 call, the stim_start is updated to the current time
         if rec_extra:
+            extra_Vms = {site: rec[site + '.v'] for site in ['ais', 'nexus', 'dist_dend', 'axon']}
             return Vm, I, t, stim, extra_Vms
         else:
             return Vm, I, t, stim
 
-    def run_model(self, start_Vm=-72, dt=0.1, rec_extra=False):
-        h.dt = dt
-        h.finitialize(start_Vm)
-        timesteps = int(h.tstop / h.dt)  # change later to h.tstop
-
-        Vm = np.zeros(timesteps)
-        I = {}
-        I['Na'] = np.zeros(timesteps)
-        I['Ca'] = np.zeros(timesteps)
-        I['K'] = np.zeros(timesteps)
-        stim = np.zeros(timesteps)
-        dend_stim = np.zeros(timesteps)
-        t = np.zeros(timesteps)
+    def run_model(self, start_Vm=-72, dt=0.1, rec_extra=False, rec_spec=None):
+        # soma v/currents, stim currents (+ extra sites, + rec_spec) recorded natively (recording.py)
+        spec = {'soma': {'site': ('soma', 0, 0.5), 'vars': ['v', 'ina', 'ica', 'ik']},
+                'st': {'site': h.st, 'vars': ['i']}}  # actual current delivered
+        if hasattr(h, 'st_dend'):
+            spec['st_dend'] = {'site': h.st_dend, 'vars': ['i']}  # dendritic stim current if st_dend is active
         if rec_extra:
-            extra_Vms = {}
-            extra_Vms['ais'] = np.zeros(timesteps)
-            extra_Vms['nexus'] = np.zeros(timesteps)
-            extra_Vms['dist_dend'] = np.zeros(timesteps)
-            extra_Vms['axon'] = np.zeros(timesteps)
-
-        for i in range(timesteps):
-            Vm[i] = h.cell.soma[0].v
-            I['Na'][i] = h.cell.soma[0](0.5).ina
-            I['Ca'][i] = h.cell.soma[0](0.5).ica
-            I['K'][i] = h.cell.soma[0](0.5).ik
-            stim[i] = h.st.i  # Changed to .i to capture actual current delivered
-
-            # Capture dendritic stim current if st_dend is active
-            if hasattr(h, 'st_dend'):
-                dend_stim[i] = h.st_dend.i
-
-            t[i] = i * h.dt / 1000
-            if rec_extra:
-                nseg = int(self.h.L / 10) * 2 + 1  # create 19 segments from this axon section
-                ais_end = 10 / nseg  # specify the end of the AIS as halfway down this section
-                ais_mid = 4 / nseg  # specify the middle of the AIS as 1/5 of this section
-                extra_Vms['ais'][i] = self.ais(ais_mid).v
-                extra_Vms['nexus'][i] = self.nexus(0.5).v
-                extra_Vms['dist_dend'][i] = self.dist_dend(0.5).v
-                extra_Vms['axon'][i] = self.axon_proper(0.5).v
-            h.fadvance()
+            spec.update(self.extra_spec())
+        spec.update(rec_spec or {})
+
+        rec = self.run_spec(spec, start_Vm, dt)
+        Vm = rec['soma.v']
+        I = {'Na': rec['soma.ina'], 'Ca': rec['soma.ica'], 'K': rec['soma.ik']}
+        stim = rec['st.i']
+        dend_stim = rec['st_dend.i'] if 'st_dend.i' in rec else np.zeros(len(Vm))
+        t = rec.t('soma.v') / 1000
         if rec_extra:
+            extra_Vms = {site: rec[site + '.v'] for site in ['ais', 'nexus', 'dist_dend', 'axon']}
             return Vm, I, t, stim, extra_Vms, dend_stim
         else:
             return Vm, I, t, stim, dend_stim
@@ -1019,7 +995,7 @@ class NeuronModel:
         'section_num': 0,
         'currents': ['ina', 'ica', 'ik'],
         'ionic_concentrations': ["cai", "ki", "nai"]
-    }):
+    }, rec_spec=None):
 
         """
         Runs a simulation model and returns voltage, current, time, and stimulation data.
@@ -1028,6 +1004,7 @@ class NeuronModel:
             start_Vm (float): Initial membrane potential (default: -72 mV).
             dt (float): Time step size for the simulation (default: 0.1 ms).
             sim_config (dict): Configuration dictionary for simulation parameters (default: see below).
+            rec_spec (dict): Additional sites to record (see recording.py); the full Recording is kept in self.recording.
 
         Returns:
             Vm (ndarray): Recorded membrane voltages over time.
@@ -1061,104 +1038,26 @@ class NeuronModel:
             })
         """
 
-        h.dt = dt
-        h.finitialize(start_Vm)
-        timesteps = int(h.tstop / h.dt)
-        # initialise to zeros,
-        # current_types = list(set(sim_config['inward'] + sim_config['outward']))
+        # probes resolved once to _ref_ pointers and recorded natively into one contiguous array (recording.py)
         current_types = sim_config['currents']
         ionic_types = sim_config['ionic_concentrations']
-        Vm = np.zeros(timesteps, dtype=np.float64)
-        I = {current_type: np.zeros(timesteps, dtype=np.float64) for current_type in current_types}
-        ionic = {ionic_type: np.zeros(timesteps, dtype=np.float64) for ionic_type in ionic_types}
-
-        ##TF062724 Adding 8state state values for every timestep
-        states12 = [["c1", "c2", "c3", "i1", "i2", "i3", "i4", "o"]]
-        states16 = [["c1", "c2", "c3", "i1", "i2", "i3", "i4", "o"]]
-
-        # print(f"I : {I}")
-        stim = np.zeros(timesteps, dtype=np.float64)
-        t = np.zeros(timesteps, dtype=np.float64)
-        section = sim_config['section']
-        section_number = sim_config['section_num']
-        segment = sim_config['segment']
-        volt_var = "h.cell.{section}[{section_number}]({segment}).v".format(section=section,
-                                                                            section_number=section_number,
-                                                                            segment=segment)
-        # print(eval("h.psection()"))
-        # print(h("topology()"))
-        # val = eval("h.cADpyr232_L5_TTPC1_0fb1ca4724[0].soma[0](0.5).na12mut.ina_ina")
-        # print(f"na16 mut {val}")
-        curr_vars = {}
-        # for current_type in current_types:
-        #     #if current_type == 'ina_ina_na12':
-        #     if current_type == 'na12.ina_ina':
-        #         curr_vars[current_type] =  "h.cell.{section}[0].{current_type}".format(section=section, segment=segment, current_type=current_type)
-        #     else:
-        #         curr_vars[current_type] = "h.cell.{section}[0]({segment}).{current_type}".format(section=section, segment=segment, current_type=current_type)
-        curr_vars = {
-            current_type: "h.cell.{section}[{section_number}]({segment}).{current_type}".format(section=section,
-                                                                                                section_number=section_number,
-                                                                                                segment=segment,
-                                                                                                current_type=current_type)
-            for current_type in current_types}
-        # print(f"current_vars : {curr_vars}") #####commented 12/11/23 TF
-        ionic_vars = {ionic_type: "h.cell.{section}[{section_number}]({segment}).{ionic_type}".format(section=section,
-                                                                                                      section_number=section_number,
-                                                                                                      segment=segment,
-                                                                                                      ionic_type=ionic_type)
-                      for ionic_type in ionic_types}
-        # print(f"ionic_vars : {ionic_vars}") ####commented 12/11/23 TF
-        print(f"############################## Timesteps____________{timesteps}")
-        for i in range(timesteps):
-
-            Vm[i] = eval(volt_var)
-
-            try:
-                for current_type in current_types:
-                    I[current_type][i] = eval(curr_vars[current_type])
-
-                # getting the ionic concentrations
-                for ionic_type in ionic_types:
-                    ionic[ionic_type][i] = eval(ionic_vars[ionic_type])
-                    # print(str(ionic_type) + "------" + str(i) + "-----" + str(eval(ionic_vars[ionic_type]))) ###for debugging
-            except Exception as e:
-                print(e)
-                print("Check the config files for the correct Attribute")
-                sys.exit(1)
-
-            stim[i] = h.st.amp
-            t[i] = i * h.dt / 1000
-
-            ##TF062724 State values for 8 state HMM model
-            #     states12.append([h.cell.soma[0].c1_na12,
-            #                h.cell.soma[0].c2_na12,
-            #                h.cell.soma[0].c3_na12,
-            #                h.cell.soma[0].i1_na12,
-            #                h.cell.soma[0].i2_na12,
-            #                h.cell.soma[0].i3_na12,
-            #                h.cell.soma[0].i4_na12,
-            #                h.cell.soma[0].o_na12])
-
-            #     states16.append([h.cell.soma[0].c1_na16,
-            #                h.cell.soma[0].c2_na16,
-            #                h.cell.soma[0].c3_na16,
-            #                h.cell.soma[0].i1_na16,
-            #                h.cell.soma[0].i2_na16,
-            #                h.cell.soma[0].i3_na16,
-            #                h.cell.soma[0].i4_na16,
-            #                h.cell.soma[0].o_na16])
-
-            h.fadvance()
-
-        ###
-        # df1 = pd.DataFrame(states12)
-        # df2 = pd.DataFrame(states16)
-        # df1.to_csv("/global/homes/t/tfenton/Neuron_general-2/Plots/Channel_state_plots/na12_channel_states.csv", header=False,index=False)
-        # df2.to_csv("/global/homes/t/tfenton/Neuron_general-2/Plots/Channel_state_plots/na16_channel_states.csv", header=False,index=False)
-        ###
-
-        # print(f"I : {I}")
+        site = (sim_config['section'], sim_config['section_num'], sim_config['segment'])
+        spec = {'sim': {'site': site, 'vars': ['v'] + current_types + ionic_types},
+                'st': {'site': h.st, 'vars': ['amp']}}
+        spec.update(rec_spec or {})
+        try:
+            recorder = Recorder(spec, h.cell)
+        except Exception as e:
+            print(e)
+            print("Check the config files for the correct Attribute")
+            sys.exit(1)
+        self.recording = rec = recorder.run(h.tstop, dt, start_Vm)
+        print(f"############################## Timesteps____________{len(rec['sim.v'])}")
+        Vm = rec['sim.v']
+        I = {current_type: rec['sim.' + current_type] for current_type in current_types}
+        ionic = {ionic_type: rec['sim.' + ionic_type] for ionic_type in ionic_types}
+        stim = rec['st.amp']
+        t = rec.t('sim.v') / 1000
         return Vm, I, t, stim, ionic
 
     def plot_crazy_stim(self, stim_csv, stim_duration=None):
@@ -40,19 +40,17 @@ def cm_to_in(cm):
 
 
 
-def get_fi_curve(mdl,s_amp,e_amp,nruns,wt_data=None,wt2_data=None, ax1=None,fig = None,dt = 0.01,fn = './Plots/ficurve.pdf'):
-    all_volts = []
-    npeaks = []
+def get_fi_curve(mdl,s_amp,e_amp,nruns,wt_data=None,wt2_data=None, ax1=None,fig = None,dt = 0.01,fn = './Plots/ficurve.pdf',
+                 model_kwargs=None,processes=None):
+    # spikes counted by threshold crossing (-30 mV, first 1000 ms) while each sweep runs, no traces kept (fi_engine.py)
+    # with model_kwargs and processes > 1, the amplitudes run in a pool of workers each building Na12Model_TF(**model_kwargs)
+    # sweeps run at count_spikes' dt (0.1 ms), the dt run_model() always ran them at; dt is not used
+    from fi_engine import count_spikes, fi_curve
     x_axis = np.linspace(s_amp,e_amp,nruns)
-    stim_length = int(600/dt)
-    stim_length2 = int(1000/dt)
-    for curr_amp in x_axis:
-        mdl.init_stim(amp = curr_amp,dt = dt)
-        curr_volts,_,_,_ = mdl.run_model()
-        #curr_peaks,_ = find_peaks(curr_volts[:stim_length],height = -20)
-        curr_peaks,_ = find_peaks(curr_volts[:stim_length2],height = -30) #modified for na16 TTX experiments
-        all_volts.append(curr_volts)
-        npeaks.append(len(curr_peaks))
+    if model_kwargs is not None and (processes or 1) > 1:
+        npeaks = fi_curve(model_kwargs, x_axis, processes)
+    else:
+        npeaks = [count_spikes(mdl, curr_amp) for curr_amp in x_axis]
     print(npeaks) #spikes at each stim current for FI curve
     if ax1 is None:
         fig,ax1 = plt.subplots(1,1)
@@ -0,0 +1,66 @@
+"""
+fi_engine.py
+
+Parallel FI curves across stimulus amplitudes.
+
+The amplitudes are spread over a process pool with one NEURON instance per worker: each worker
+builds the model once (Na12Model_TF(**model_kwargs)) and then runs one sweep per amplitude.
+Spikes are counted while the sweep runs, as upward threshold crossings of the somatic voltage
+(NetCon.record), so no voltage trace is kept. Workers are started with 'spawn', so they never
+inherit a model already built in the calling process.
+
+Usage:
+    amps = np.linspace(0, 0.6, 14)
+    counts = fi_curve(model_kwargs, amps, processes=8)
+    curves = variant_fi_curves('R850P', amps, processes=8)     # {'WT': [...], 'R850P': [...]}
+"""
+
+import multiprocessing as mp
+import os
+
+import numpy as np
+from neuron import h
+
+from recording import Recorder
+from variant_table import default_csv, get_variant_params
+
+_worker_model = None  # model built once per worker process
+
+
+def count_spikes(mdl, amp, dt=0.1, threshold=-30, window=1000, start_Vm=-72, stim_kwargs=None):
+    """Number of spikes (threshold crossings of soma v in the first window ms) of one sweep at stim amplitude amp"""
+    mdl.init_stim(amp=amp, dt=dt, **(stim_kwargs or {}))
+    soma = h.cell.soma[0]
+    nc = h.NetCon(soma(0.5)._ref_v, None, sec=soma)
+    nc.threshold = threshold
+    spike_times = h.Vector()
+    nc.record(spike_times)
+    Recorder().run(h.tstop, dt, start_Vm)  # no traces recorded
+    return int(np.count_nonzero(spike_times.as_numpy() < window))
+
+
+def _init_worker(model_kwargs):
+    global _worker_model
+    from Na12HH16HHModel_TF import Na12Model_TF
+    _worker_model = Na12Model_TF(**model_kwargs).l5mdl
+
+
+def _worker_count(args):
+    amp, count_kwargs = args
+    return count_spikes(_worker_model, amp, **count_kwargs)
+
+
+def fi_curve(model_kwargs, amps, processes=None, **count_kwargs):
+    """Spike count for each amplitude, from a pool of workers each running Na12Model_TF(**model_kwargs)"""
+    amps = [float(amp) for amp in amps]
+    processes = min(processes or os.cpu_count(), len(amps))
+    with mp.get_context('spawn').Pool(processes, initializer=_init_worker, initargs=(model_kwargs,)) as pool:
+        return pool.map(_worker_count, [(amp, count_kwargs) for amp in amps], chunksize=1)
+
+
+def variant_fi_curves(variant, amps, csv_fn=default_csv, model_kwargs=None, processes=None, **count_kwargs):
+    """WT and mutant FI curves of a variant of the variant table: {'WT': counts, variant: counts}"""
+    model_kwargs = dict(model_kwargs or {})
+    mut_kwargs = dict(model_kwargs, variant_params=get_variant_params(variant, csv_fn))
+    return {'WT': fi_curve(model_kwargs, amps, processes, **count_kwargs),
+            variant: fi_curve(mut_kwargs, amps, processes, **count_kwargs)}
@@ -0,0 +1,131 @@
+"""
+recording.py
+
+Declarative recording for single-cell runs.
+
+A recording spec maps site names to the variables recorded there and their sampling interval:
+
+    rec_spec = {
+        'soma':  {'site': ('soma', 0, 0.5), 'vars': ['v', 'ina', 'ica', 'ik']},
+        'nexus': {'site': ('apic', 66, 0.5), 'vars': ['v'], 'dt': 0.1},
+        'st':    {'site': h.st, 'vars': ['i']},
+    }
+
+A site is (section, index, loc) of the cell, or a NEURON segment / point process used as is;
+variables are range variables or 'mech.var' (e.g. 'na16.ina_ina'); 'dt' (ms, default: every
+time step) must be a multiple of h.dt. Each variable is resolved once to a _ref_ pointer and
+recorded natively with Vector.record while NEURON integrates the sweep (h.continuerun), so
+recording 20 dendritic sites costs 20 probes rather than a 20x slower per-step Python loop.
+The result is one contiguous float64/float32 array with named columns ('<site>.<var>'), each a
+view: recording['soma.v'], recording.t('soma.v').
+"""
+
+import numpy as np
+from neuron import h
+
+
+def resolve_ref(target, var):
+    """_ref_ pointer to a variable of a segment or point process: 'var' or 'mech.var'"""
+    if '.' in var:
+        mech, name = var.split('.', 1)
+        return getattr(getattr(target, mech), '_ref_' + name)
+    return getattr(target, '_ref_' + var)
+
+
+def site_target(site, cell=None):
+    """Segment or point process of a site: (section, index, loc) of cell (default h.cell), or a NEURON object"""
+    if isinstance(site, (tuple, list)):
+        section, index, loc = site
+        return getattr(h.cell if cell is None else cell, section)[index](loc)
+    return site
+
+
+def spec_columns(rec_spec, cell=None):
+    """[(column name, _ref_ pointer, sampling interval)] of a recording spec"""
+    columns = []
+    for site_name, entry in rec_spec.items():
+        target = site_target(entry['site'], cell)
+        for var in entry['vars']:
+            columns.append((f'{site_name}.{var}', resolve_ref(target, var), entry.get('dt')))
+    return columns
+
+
+class Recording:
+    """Recorded columns backed by one contiguous array; recording[name] is a view of its samples"""
+
+    def __init__(self, names, lengths, intervals, t0=0.0, dtype=np.float64):
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+        self.data = np.zeros(offsets[-1], dtype=dtype)
+        self.columns = {name: (offsets[i], lengths[i], intervals[i]) for i, name in enumerate(names)}
+        self.t0 = t0
+
+    def __getitem__(self, name):
+        start, n, _ = self.columns[name]
+        return self.data[start:start + n]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def t(self, name):
+        """Sample times (ms) of a column"""
+        _, n, interval = self.columns[name]
+        return self.t0 + np.arange(n) * interval
+
+    def site(self, site_name):
+        """{var: samples} of one site"""
+        prefix = site_name + '.'
+        return {name[len(prefix):]: self[name] for name in self.columns if name.startswith(prefix)}
+
+
+class Recorder:
+    """Probes of a recording spec, recorded over one sweep"""
+
+    def __init__(self, rec_spec=None, cell=None):
+        self.columns = spec_columns(rec_spec, cell) if rec_spec else []
+
+    def record(self, name, ref, interval=None):
+        """Add a probe of ref (e.g. seg._ref_v, h.st._ref_i) as column name"""
+        self.columns.append((name, ref, interval))
+
+    def run(self, tstop, dt, start_Vm, dtype=np.float64):
+        """Initialize to start_Vm, integrate to tstop with fixed step dt and return the Recording"""
+        vecs = []
+        for _, ref, interval in self.columns:
+            vec = h.Vector()
+            if interval:
+                vec.record(ref, interval)
+            else:
+                vec.record(ref)
+            vecs.append(vec)
+
+        h.dt = dt
+        h.steps_per_ms = 1.0 / dt  # one fadvance per stdrun step, so setdt() keeps dt
+        h.setdt()
+        h.finitialize(start_Vm)
+        h.continuerun(tstop)
+
+        # samples at t = 0, interval, ..., as many as the per-step loops took (int(tstop / dt))
+        intervals = [interval or dt for _, _, interval in self.columns]
+        lengths = [min(int(tstop / interval), int(vec.size())) for interval, vec in zip(intervals, vecs)]
+        recording = Recording([name for name, _, _ in self.columns], lengths, intervals, dtype=dtype)
+        for (name, _, _), vec, n in zip(self.columns, vecs, lengths):
+            recording[name][:] = vec.as_numpy()[:n]
+        return recording
+
+    def step(self, nsteps, dt, dtype=np.float64):
+        """
+        Continue nsteps fixed steps from the current state (no finitialize) and return the Recording;
+        the pointers are read before each h.fadvance(), as sweeps continued in several calls need
+        """
+        h.dt = dt
+        strides = [max(int(round(interval / dt)), 1) if interval else 1 for _, _, interval in self.columns]
+        lengths = [(nsteps + stride - 1) // stride for stride in strides]
+        recording = Recording([name for name, _, _ in self.columns], lengths,
+                              [stride * dt for stride in strides], t0=h.t, dtype=dtype)
+        probes = [(recording[name], ref, stride) for (name, ref, _), stride in zip(self.columns, strides)]
+        for i in range(nsteps):
+            for samples, ref, stride in probes:
+                if i % stride == 0:
+                    samples[i // stride] = ref[0]
+            h.fadvance()
+        return recording
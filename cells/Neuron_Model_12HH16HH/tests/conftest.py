@@ -0,0 +1,6 @@
+import os
+import sys
+
+modelFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if modelFolder not in sys.path:
+    sys.path.insert(0, modelFolder)  # model modules are imported by name, as in the run scripts
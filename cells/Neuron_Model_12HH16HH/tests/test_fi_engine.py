@@ -0,0 +1,55 @@
+import os
+import platform
+
+import numpy as np
+import pytest
+
+from conftest import modelFolder
+
+# compiled mechanisms of this platform (nrnivmodl mechanisms, run in the model folder)
+mechLibs = [os.path.join(modelFolder, platform.machine(), name)
+            for name in ['libnrnmech.so', 'libnrnmech.dylib', os.path.join('.libs', 'libnrnmech.so')]]
+mechLib = next((lib for lib in mechLibs if os.path.exists(lib)), None)
+pytestmark = pytest.mark.skipif(mechLib is None, reason='mechanisms not compiled for this platform')
+
+amps = [0.0, 0.3, 0.6]
+
+
+@pytest.fixture(scope='module')
+def mdl():
+    from neuron import h
+    from NeuronModelClass import NeuronModel
+
+    if not h.name_declared('na12'):  # not loaded from the working folder at import
+        h.nrn_load_dll(mechLib)
+    runFolder = os.getcwd()
+    try:  # Na12Model_TF defaults
+        yield NeuronModel(nav12=1.17975, nav16=2.574, axon_K=0.4, axon_Kp=0.00590625, axon_Kt=0.00075, soma_K=2.2,
+                          ais_ca=21.5, ais_KCa=0.5, soma_nav16=0.8, soma_nav12=2.9952, node_na=1,
+                          ais_nav16_fac=2.187, ais_nav12_fac=5.184, dend_nav12=1.9305, dend_nav16=3.3,
+                          dend_K=0.025, na16mechs=['na16', 'na16'], mod_dir=modelFolder,
+                          params_folder=os.path.join(modelFolder, 'params', ''))
+    finally:
+        os.chdir(runFolder)  # NeuronModel changes to mod_dir
+
+
+def _find_peaks_counts(mdl):
+    """ FI counts as get_fi_curve computed them before the streaming count: find_peaks of run_model traces """
+    from scipy.signal import find_peaks
+
+    counts = []
+    for amp in amps:
+        mdl.init_stim(amp=amp, dt=0.01)
+        volts = mdl.run_model()[0]
+        counts.append(len(find_peaks(volts[:int(1000 / 0.01)], height=-30)[0]))
+    return counts
+
+
+def test_streamingCountMatchesFindPeaks(mdl, tmp_path):
+    from fi_engine import count_spikes
+    from NrnHelper import get_fi_curve
+
+    expected = _find_peaks_counts(mdl)
+    assert expected[0] == 0 and expected[-1] > expected[1] > 0
+    assert [count_spikes(mdl, amp) for amp in amps] == expected
+    assert get_fi_curve(mdl, amps[0], amps[-1], len(amps), fn=str(tmp_path / 'ficurve.pdf')) == expected
@@ -0,0 +1,179 @@
+"""
+variant_scan.py
+
+Batch scan of the NaV1.2 variants in MutantParameters_updated_062725.csv.
+
+Every variant (x every conductance scaling) runs the standard single-cell protocol in a worker
+process with a fresh NEURON instance and its own Na12Model_TF (variant_params from the variant
+table): FI curve (streaming spike counts, fi_engine.py), one sweep at ap_amp with the soma, AIS
+and axon voltages recorded (recording.py), dV/dt phase summary, first-AP features and AP
+initiation site. No figures are written; the results go to one table with a row per
+(variant, scaling), rewritten as rows complete:
+
+    variant, scaling, error, rheobase, fi_<amp>..., n_spikes, latency, threshold, peak, amplitude,
+    half_width, ahp, dvdt_max, dvdt_min, init_site, ais_lead, axon_lead
+
+(mV, ms, mV/ms; ais_lead/axon_lead: ms by which the AIS/axon crossing precedes the soma's)
+
+Usage:
+    python variant_scan.py --processes 16 --scale nav12=0.5,1,2 --out ./Plots/variant_scan.csv
+    rows = scan_variants(variants=['WT', 'R119I'], scalings=[{}, {'nav12': 0.5}], processes=2)
+"""
+
+import argparse
+import inspect
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+
+from variant_table import default_csv, load_variant_table
+
+default_protocol = {'fi_amps': list(np.linspace(0, 0.6, 14)), 'fi_dt': 0.1,
+                    'ap_amp': 0.5, 'ap_dt': 0.005, 'sweep_len': 700, 'stim_start': 100, 'stim_dur': 500,
+                    'spike_height': -20, 'cross_v': -30, 'dvdt_threshold': 20}
+
+
+# ------------------------------------------------------------------------------
+# Features of a sweep
+# ------------------------------------------------------------------------------
+def first_crossing(volts, level, start=0):
+    """Index of the first upward crossing of level at or after start (None if none)"""
+    above = np.flatnonzero(volts[start:] >= level)
+    return start + int(above[0]) if len(above) else None
+
+
+def first_ap_features(Vm, dt, protocol):
+    """Spike count and first-AP features (threshold, peak, amplitude, half-width, AHP, dV/dt) of a soma trace"""
+    from scipy.signal import find_peaks
+
+    peaks, _ = find_peaks(Vm, height=protocol['spike_height'])
+    features = {'n_spikes': len(peaks)}
+    if not len(peaks):
+        return features, None
+
+    dvdt = np.gradient(Vm, dt)
+    p0 = int(peaks[0])
+    onset = max(p0 - int(5 / dt), 0)
+    rising = np.flatnonzero(dvdt[onset:p0] >= protocol['dvdt_threshold'])
+    i_thr = onset + int(rising[0]) if len(rising) else onset
+    end = int(peaks[1]) if len(peaks) > 1 else min(p0 + int(20 / dt), len(Vm))
+
+    threshold, peak = float(Vm[i_thr]), float(Vm[p0])
+    half = threshold + (peak - threshold) / 2
+    below = np.flatnonzero(Vm[i_thr:end] < half) + i_thr
+    rise = below[below < p0].max(initial=i_thr - 1) + 1  # first sample above half before the peak
+    fall = below[below > p0].min(initial=end)  # first sample below half after the peak
+    width = fall - rise
+    features.update({'latency': i_thr * dt - protocol['stim_start'], 'threshold': threshold, 'peak': peak,
+                     'amplitude': peak - threshold, 'half_width': width * dt,
+                     'ahp': float(Vm[p0:end].min()),
+                     'dvdt_max': float(dvdt[i_thr:end].max()), 'dvdt_min': float(dvdt[i_thr:end].min())})
+    return features, onset
+
+
+def init_site(site_volts, onset, dt, level):
+    """AP initiation site: the site whose voltage first crosses level for the first AP, and leads (ms) over the soma"""
+    times = {}
+    for site, volts in site_volts.items():
+        i = first_crossing(volts, level, onset)
+        if i is not None:
+            times[site] = i * dt
+    if not times:
+        return {}
+    result = {'init_site': min(times, key=times.get)}
+    for site in ['ais', 'axon']:
+        if site in times and 'soma' in times:
+            result[f'{site}_lead'] = times['soma'] - times[site]
+    return result
+
+
+# ------------------------------------------------------------------------------
+# One variant x scaling (runs in its own process)
+# ------------------------------------------------------------------------------
+def model_defaults():
+    """Default Na12Model_TF kwargs (conductance factors that scalings multiply)"""
+    from Na12HH16HHModel_TF import Na12Model_TF
+    return {name: param.default for name, param in inspect.signature(Na12Model_TF.__init__).parameters.items()
+            if param.default is not inspect.Parameter.empty}
+
+
+def scan_variant(task):
+    """Protocol results (one table row) for task = (variant, scaling, csv_fn, protocol, model_kwargs)"""
+    variant, scaling, csv_fn, protocol, model_kwargs = task
+    row = {'variant': variant, 'scaling': ' '.join(f'{k}={v:g}' for k, v in sorted(scaling.items())) or 'none',
+           'error': ''}
+    try:
+        from Na12HH16HHModel_TF import Na12Model_TF
+        from fi_engine import count_spikes
+        from variant_table import get_variant_params
+
+        defaults = model_defaults()
+        kwargs = dict(model_kwargs, **{k: defaults[k] * f for k, f in scaling.items()})
+        mdl = Na12Model_TF(variant_params=get_variant_params(variant, csv_fn), **kwargs).l5mdl
+        stim_kwargs = {'sweep_len': protocol['sweep_len'], 'stim_start': protocol['stim_start'],
+                       'stim_dur': protocol['stim_dur']}
+
+        fi = [count_spikes(mdl, amp, dt=protocol['fi_dt'], threshold=protocol['cross_v'], stim_kwargs=stim_kwargs)
+              for amp in protocol['fi_amps']]
+        row['rheobase'] = next((amp for amp, n in zip(protocol['fi_amps'], fi) if n > 0), np.nan)
+        row.update({f'fi_{amp:.3f}': n for amp, n in zip(protocol['fi_amps'], fi)})
+
+        dt = protocol['ap_dt']
+        mdl.init_stim(amp=protocol['ap_amp'], dt=dt, **stim_kwargs)
+        Vm, _, _, _, extra_Vms, _ = mdl.run_model(dt=dt, rec_extra=True)
+        features, onset = first_ap_features(Vm, dt, protocol)
+        row.update(features)
+        if onset is not None:
+            row.update(init_site({'soma': Vm, 'ais': extra_Vms['ais'], 'axon': extra_Vms['axon']}, onset, dt,
+                                 protocol['cross_v']))
+    except Exception as e:  # keep scanning the other variants
+        row['error'] = f'{type(e).__name__}: {e}'
+    return row
+
+
+# ------------------------------------------------------------------------------
+# Scan
+# ------------------------------------------------------------------------------
+def scan_variants(csv_fn=default_csv, variants=None, scalings=None, processes=None, out_fn=None, protocol=None,
+                  model_kwargs=None):
+    """Run the protocol for every variant x scaling in a pool of processes; returns the results table"""
+    csv_fn = os.path.abspath(csv_fn)
+    variants = variants or list(load_variant_table(csv_fn))
+    scalings = scalings or [{}]
+    protocol = dict(default_protocol, **(protocol or {}))
+    tasks = [(variant, scaling, csv_fn, protocol, model_kwargs or {}) for variant in variants for scaling in scalings]
+
+    rows = []
+    processes = min(processes or os.cpu_count(), len(tasks))
+    # one task per process: each model is built in a fresh NEURON instance
+    with mp.get_context('spawn').Pool(processes, maxtasksperchild=1) as pool:
+        for row in pool.imap_unordered(scan_variant, tasks):
+            rows.append(row)
+            print(f"{len(rows)}/{len(tasks)} {row['variant']} {row['scaling']} {row['error']}")
+            if out_fn:
+                pd.DataFrame(rows).to_csv(out_fn, index=False)
+    return pd.DataFrame(rows)
+
+
+def parse_scalings(specs):
+    """['nav12=0.5,1,2', 'KP=1,2'] -> all combinations as [{'nav12': 0.5, 'KP': 1.0}, ...]"""
+    scalings = [{}]
+    for spec in specs or []:
+        name, factors = spec.split('=')
+        scalings = [dict(scaling, **{name: float(f)}) for scaling in scalings for f in factors.split(',')]
+    return scalings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scan NaV1.2 variants: FI, dV/dt, first-AP features, AP initiation site')
+    parser.add_argument('--csv', default=default_csv, help='variant table')
+    parser.add_argument('--variants', nargs='*', help='variants to scan (default: all rows)')
+    parser.add_argument('--scale', nargs='*', help='conductance scalings, e.g. nav12=0.5,1,2 (x Na12Model_TF default)')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', default='./Plots/variant_scan.csv')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    scan_variants(args.csv, args.variants, parse_scalings(args.scale), args.processes, args.out)
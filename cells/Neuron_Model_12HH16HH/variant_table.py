@@ -0,0 +1,36 @@
+"""
+variant_table.py
+
+In-memory table of NaV1.2 variant parameters (MutantParameters_updated_062725.csv).
+
+The csv is parsed once per process and indexed by variant name, so the na12mut parameters
+for a variant can be passed directly to Na12Model_TF/NeuronModel (variant_params=...) instead
+of being written to params/na12annaTFHH2mut.txt and read back.
+"""
+
+import csv
+import os
+from functools import lru_cache
+
+default_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MutantParameters_updated_062725.csv')
+
+
+@lru_cache(maxsize=None)
+def load_variant_table(csv_fn=default_csv):
+    """Parse the variant csv into {variant: {param: float}} (first column is the variant name)"""
+    table = {}
+    with open(csv_fn, mode='r', newline='') as f:
+        reader = csv.DictReader(f)
+        key_field = reader.fieldnames[0]
+        for row in reader:
+            key = row.pop(key_field)
+            table[key] = {k: float(v) for k, v in sorted(row.items())}
+    return table
+
+
+def get_variant_params(variant, csv_fn=default_csv):
+    """Return a copy of the na12mut parameter dict for variant"""
+    table = load_variant_table(os.path.abspath(csv_fn))
+    if variant not in table:
+        raise KeyError(f'variant {variant} not in {csv_fn}; available: {sorted(table)}')
+    return dict(table[variant])
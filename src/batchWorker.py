@@ -0,0 +1,152 @@
+"""
+batchWorker.py
+
+Persistent worker for weight-only batch searches.
+
+The network is created and wired once; each subsequent parameter set (batch-style mappings,
+e.g. {"EEGain": 0.4, "IEweights.1": 0.5, "weightLong.TPO": 0.25}) only changes connection
+weights. For each set the worker rebuilds netParams for the new cfg, rescales the existing
+NetCon weights in place by connection class (conn rule), reinitializes and reruns the
+simulation, and reports the results (pop rates and loss) of each run.
+
+Parameter sets are read by rank 0 as one json dict per line from cfg.workerParamsFile (or stdin
+if None) and broadcast to all ranks; results are printed and appended as json lines to
+cfg.workerResultsFile. Parameters other than connection weights are rejected, since they would
+require rebuilding the network.
+
+Usage (init_batch.py with cfg.persistentWorker = True):
+    mpiexec -n 4 nrniv -python -mpi init_batch.py
+
+The weight classes are the conn rule labels of the conns (connGen.connectCells() sets
+cfg.includeParamsLabel for the persistent worker).
+"""
+
+import json
+import sys
+
+from connSnapshot import weightOnlyFields, ruleLabels, ruleWeightScale
+import netParamsCache
+
+
+# ------------------------------------------------------------------------------
+# Parameter sets
+# ------------------------------------------------------------------------------
+def _setPath(obj, path, value):
+    """ Set a batch-style mapping (e.g. 'IEweights.1') on cfg """
+    keys = path.split('.')
+    for key in keys[:-1]:
+        obj = obj[int(key)] if isinstance(obj, list) else obj[key] if isinstance(obj, dict) else getattr(obj, key)
+    if isinstance(obj, list):
+        obj[int(keys[-1])] = value
+    elif isinstance(obj, dict):
+        obj[keys[-1]] = value
+    else:
+        setattr(obj, keys[-1], value)
+
+
+def applyParams(cfg, params):
+    """ Restore cfg to its state before the last netParams build and apply a parameter set """
+    invalid = [path for path in params if path.split('.')[0] not in weightOnlyFields]
+    if invalid:
+        raise ValueError('Persistent worker only supports weight-only params (%s); got %s'
+                         % (', '.join(weightOnlyFields), ', '.join(invalid)))
+
+    for k, v in netParamsCache.cfgBeforeBuild.items():
+        setattr(cfg, k, v)
+    if hasattr(cfg, '_runner'):
+        cfg._runner.mappings.update(params)  # cfg.update() (called again by netParams.py) applies the mappings
+    for path, value in params.items():
+        _setPath(cfg, path, value)
+
+
+def readParams(cfg):
+    """ Next parameter set on rank 0, broadcast to all ranks (None when there are no more) """
+    from netpyne import sim
+
+    params = None
+    if sim.rank == 0:
+        if not hasattr(sim, '_workerParamsFile'):
+            sim._workerParamsFile = open(cfg.workerParamsFile, 'r') if cfg.workerParamsFile else sys.stdin
+        for line in sim._workerParamsFile:
+            if line.strip():
+                params = json.loads(line)
+                break
+    return sim.pc.py_broadcast(params, 0)
+
+
+# ------------------------------------------------------------------------------
+# Weight update and rerun
+# ------------------------------------------------------------------------------
+def _classFactor(oldNetParams, newNetParams, label):
+    """ Weight factor for conns created by conn rule label """
+    oldScale, newScale = ruleWeightScale(oldNetParams, label), ruleWeightScale(newNetParams, label)
+    if oldScale is None or newScale is None:
+        raise ValueError('Conn rule %s does not have a numeric weight' % label)
+    if oldScale == 0.0:
+        if newScale != 0.0:
+            raise ValueError('Cannot rescale conn rule %s with weight 0' % label)
+        return 1.0
+    return newScale / oldScale
+
+
+def updateWeights(newNetParams):
+    """ Rescale the weights of the existing conns by class and set them in the NetCons """
+    from netpyne import sim
+
+    oldNetParams = sim.net.params
+    if ruleLabels(newNetParams) != ruleLabels(oldNetParams):
+        raise ValueError('Conn rules changed between parameter sets; the network has to be rebuilt')
+
+    labels = set(ruleLabels(oldNetParams))
+    factors = {}
+    for cell in sim.net.cells + getattr(sim.net, 'splitPieces', []):
+        for conn in cell.conns:
+            label = conn.get('label')
+            if label is None and isinstance(conn.get('preGid'), int):
+                raise ValueError('Conn of cell %d has no conn rule label; weight updates require cfg.includeParamsLabel'
+                                 % cell.gid)
+            if label not in factors:
+                isRule = isinstance(label, str) and (label in labels or label.rsplit('_', 2)[0] in labels)
+                factors[label] = _classFactor(oldNetParams, newNetParams, label) if isRule else 1.0  # eg. stims
+            if factors[label] != 1.0:
+                conn['weight'] *= factors[label]
+                if 'hObj' in conn:
+                    conn['hObj'].weight[0] = conn['weight']
+
+    sim.net.params = newNetParams
+
+
+def rerun():
+    """ Reinitialize and rerun the simulation with the current weights, then gather the data """
+    from netpyne import sim
+
+    for key in ['spkt', 'spkid']:
+        sim.simData[key].resize(0)
+    sim.fih = []  # handlers are added again by preRun
+    sim.runSim()
+    sim.gatherData()
+
+
+def runWorker(cfg, trialResults):
+    """
+    Run the current network, then each parameter set read by readParams(); trialResults() returns
+    the results dict of the last run (called on rank 0).
+    """
+    from netpyne import sim
+
+    sim.runSim()
+    sim.gatherData()
+    while True:
+        if sim.rank == 0:
+            out_json = json.dumps(trialResults())
+            print(out_json)
+            if cfg.workerResultsFile:
+                with open(cfg.workerResultsFile, 'a') as fileObj:
+                    fileObj.write(out_json + '\n')
+
+        params = readParams(cfg)
+        if params is None:
+            break
+        applyParams(cfg, params)
+        updateWeights(netParamsCache.loadNetParams(cfg))
+        rerun()
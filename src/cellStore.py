@@ -0,0 +1,135 @@
+"""
+cellStore.py
+
+Array-backed store for large cell rules (e.g. the 700+ compartment PT5B_full).
+
+A cell rule is packed into a folder with:
+  pt3d.npy    float32 (npts, 4) array with the 3D points of all sections
+  values.npy  float64 array with the per-segment values (mech params, weightNorm), columnar
+  meta.json   section table (geom/topol/other scalars, pt3d and value offsets) and rule-level params
+
+netParams keeps only a small placeholder rule ({'conds', 'store'}) so the netParams sent to each
+rank stays small. The store is memory-mapped by all ranks (one copy in the node page cache) and
+expanded into a regular cell rule just for sim.net.createCells(); pt3d rows are views into the
+mapped array, while mech values are materialized as lists because NetPyNE requires list values.
+
+Usage:
+    netParams.cellParams[label] = storeCellRule(netParams.cellParams[label], folder)   # netParams.py
+    from cellStore import createCells; createCells()   # instead of sim.net.createCells()
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from numbers import Number
+
+import numpy as np
+
+from fileUtils import atomicFolder
+
+# per-segment values stored in values.npy (all other sec params go to meta.json)
+arrayKeys = ['mechs', 'weightNorm']
+
+
+# ------------------------------------------------------------------------------
+# Pack
+# ------------------------------------------------------------------------------
+def packCellRule(rule, folder):
+    """ Write cell rule to folder as pt3d/values arrays + meta json """
+    pt3d, values = [], []
+    secs = {}
+    for secName, sec in rule['secs'].items():
+        secMeta = {k: v for k, v in sec.items() if k not in arrayKeys + ['geom']}
+        secMeta['geom'] = {k: v for k, v in sec.get('geom', {}).items() if k != 'pt3d'}
+
+        points = sec.get('geom', {}).get('pt3d')
+        if points is not None:
+            secMeta['pt3d'] = [len(pt3d), len(pt3d) + len(points)]
+            pt3d.extend(points)
+
+        # columnar values: [start, stop, isList] per param; scalars stored as 1 value
+        secMeta['mechs'] = {}
+        for mechName, mech in sec.get('mechs', {}).items():
+            secMeta['mechs'][mechName] = {}
+            for paramName, value in mech.items():
+                isList = isinstance(value, (list, tuple, np.ndarray))
+                vals = list(value) if isList else [value]
+                if not all(isinstance(v, Number) for v in vals):  # eg. string functions: keep in meta
+                    secMeta['mechs'][mechName][paramName] = {'value': value}
+                    continue
+                secMeta['mechs'][mechName][paramName] = [len(values), len(values) + len(vals), isList]
+                values.extend(vals)
+        if isinstance(sec.get('weightNorm'), (list, tuple, np.ndarray)):
+            secMeta['weightNorm'] = [len(values), len(values) + len(sec['weightNorm'])]
+            values.extend(sec['weightNorm'])
+        secs[secName] = secMeta
+
+    meta = {'rule': {k: v for k, v in rule.items() if k != 'secs'}, 'secs': secs}
+
+    with atomicFolder(folder) as tmpFolder:  # kept as is if already written by another process
+        np.save(os.path.join(tmpFolder, 'pt3d.npy'), np.array(pt3d, dtype=np.float32).reshape(-1, 4))
+        np.save(os.path.join(tmpFolder, 'values.npy'), np.array(values, dtype=np.float64))
+        with open(os.path.join(tmpFolder, 'meta.json'), 'w') as fileObj:
+            json.dump(meta, fileObj)
+
+
+def storeCellRule(rule, storeFolder):
+    """ Pack rule into storeFolder/<hash of rule> (if not there yet) and return the placeholder rule """
+    ruleDict = rule.todict() if hasattr(rule, 'todict') else rule
+    key = hashlib.sha1(pickle.dumps(ruleDict, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    folder = os.path.join(storeFolder, key)
+    if not os.path.exists(folder):
+        os.makedirs(storeFolder, exist_ok=True)
+        packCellRule(ruleDict, folder)
+    return {'conds': ruleDict.get('conds', {}), 'store': folder}
+
+
+# ------------------------------------------------------------------------------
+# Load
+# ------------------------------------------------------------------------------
+def loadCellRule(folder):
+    """ Cell rule dict from a store folder (pt3d rows are views into the memory-mapped array) """
+    with open(os.path.join(folder, 'meta.json'), 'r') as fileObj:
+        meta = json.load(fileObj)
+    pt3d = np.load(os.path.join(folder, 'pt3d.npy'), mmap_mode='r')
+    values = np.load(os.path.join(folder, 'values.npy'), mmap_mode='r')
+
+    rule = dict(meta['rule'])
+    rule['secs'] = {}
+    for secName, secMeta in meta['secs'].items():
+        sec = {k: v for k, v in secMeta.items() if k not in arrayKeys + ['pt3d']}
+        if 'pt3d' in secMeta:
+            start, stop = secMeta['pt3d']
+            sec['geom']['pt3d'] = list(pt3d[start:stop])
+        sec['mechs'] = {}
+        for mechName, mech in secMeta['mechs'].items():
+            sec['mechs'][mechName] = {}
+            for paramName, index in mech.items():
+                if isinstance(index, dict):
+                    sec['mechs'][mechName][paramName] = index['value']
+                    continue
+                start, stop, isList = index
+                vals = values[start:stop].tolist()
+                sec['mechs'][mechName][paramName] = vals if isList else vals[0]
+        if 'weightNorm' in secMeta:
+            start, stop = secMeta['weightNorm']
+            sec['weightNorm'] = values[start:stop].tolist()
+        rule['secs'][secName] = sec
+    return rule
+
+
+def createCells():
+    """ sim.net.createCells() with stored cell rules expanded only while the cells are created """
+    from netpyne import sim
+
+    cellParams = sim.net.params.cellParams
+    stored = {label: rule for label, rule in cellParams.items() if 'store' in rule}
+    for label, rule in stored.items():
+        cellParams[label] = loadCellRule(rule['store'])
+
+    cells = sim.net.createCells()
+
+    for label, rule in stored.items():
+        cellParams[label] = rule  # keep saved netParams small; cells already hold what they need
+    return cells
@@ -37,11 +37,30 @@ cfg.oneSynPerNetcon = True  # only affects conns not in subconnParams; produces
 
 cfg.includeParamsLabel = False  # True # needed for modify synMech False
 cfg.printPopAvgRates = [1000., 5000.]
+cfg.reducePopRates = False  # batch trials: pop rates for the loss from per-rank counts + one allreduce (popRates.py)
+cfg.trialGather = True  # batch trials: gather, save and plot the full data (False implies reducePopRates)
+cfg.metricsOnly = False  # batch trials: no traces, figures or saved data; one summary json per trial (trialProfile.py)
+cfg.earlyStop = False  # batch trials: stop when the running pop rates (earlyStopParams window) saturate the loss
+cfg.earlyStopParams = {'window': [100.0, None], 'minTime': 150.0, 'interval': 250.0, 'fraction': 1.0}  # rates over [window start, t], checked at window start + minTime and every interval ms (rateMonitor.py)
 
 cfg.checkErrors = False
 
+cfg.cacheNetParams = True  # reuse netParams built with identical inputs and cfg (see netParamsCache.py)
+cfg.netParamsCacheFolder = '../data/netParamsCache'
+cfg.broadcastNetParams = True  # build/load netParams on rank 0 only and broadcast to other ranks
+cfg.cellParamsStore = False  # keep PT5B_full rule in a memory-mapped array store shared by ranks (see cellStore.py)
+cfg.cellParamsStoreFolder = '../data/cellParamsStore'
+cfg.balanceCells = False  # distribute cells across ranks by estimated cost instead of round-robin (see loadBalance.py)
+cfg.cellCostProfile = None  # json file with measured cost per cell of each pop (overrides the estimate)
+cfg.multisplit = False  # split PT5B_full cells with NEURON multisplit: 'ranks' or 'threads' (see multiSplit.py)
+cfg.multisplitParams = {'cellRules': ['PT5B_full'], 'maxPieces': 4, 'nthread': 2}
+
 cfg.saveInterval = 100  # define how often the data is saved, this can be used with interval run if you want to update the weights more often than you save
 cfg.intervalFolder = 'interval_saving'
+cfg.streamData = False  # append spikes/traces of each rank to disk every saveInterval ms (see dataStream.py)
+cfg.saveShards = False  # each rank saves its spikes/traces/cells to its own shard, without gather (dataStream.py)
+cfg.outputProfile = 'standard'  # 'standard': NetPyNE saveData; 'compact': binary shards + params by hash (paramStore.py)
+cfg.paramStoreFolder = '../data/paramStore'
 
 
 # ------------------------------------------------------------------------------
@@ -111,6 +130,7 @@ cfg.cellmod = {'IT2': 'HH_reduced',
                'PT5B': 'HH_full',
                'IT6': 'HH_reduced',
                'CT6': 'HH_reduced'}
+cfg.lazyCellParams = True  # only load/build the cell rules used by the populations
 
 cfg.ihModel = 'migliore'  # ih model
 cfg.ihGbar = 0.5  # multiplicative factor for ih gbar in PT cells
@@ -136,6 +156,7 @@ cfg.makeKgbarFactorEqualToNewFactor = False
 
 cfg.modifyMechs = {'startTime': 1e20 * 500, 'endTime': 1e20 * 1000, 'cellType': 'PT', 'mech': 'hd',
                        'property': 'gbar', 'newFactor': 1.00, 'origFactor': 0.75}
+cfg.modifyMechsExtra = []  # additional scheduled changes (dicts with the same keys as cfg.modifyMechs)
 
 cfg.PTNaFactor = 1
 
@@ -157,6 +178,12 @@ cfg.weightNorm = 1  # use weight normalization
 cfg.weightNormThreshold = 4.0  # weight normalization factor threshold
 
 cfg.addConn = 1
+cfg.vectorizedConn = False  # sample local E->E/E->I conns from conn.pkl bins with numpy after cells are created (connGen.py)
+cfg.connSnapshot = False  # save/reuse conns across trials that only change weights (connSnapshot.py)
+cfg.connSnapshotFolder = '../data/connSnapshot'
+cfg.persistentWorker = False  # init_batch.py: build once, then rerun for each weight-only param set (batchWorker.py)
+cfg.workerParamsFile = None  # json dict per line with batch-style params (None = read from stdin)
+cfg.workerResultsFile = '../data/batchWorker_results.jsonl'
 cfg.allowConnsWithWeight0 = True
 cfg.allowSelfConns = False
 cfg.scale = 1
@@ -263,3 +290,10 @@ cfg.sodiumMechs = ['na12', 'na12mut', 'Nafx', 'nax', 'na16mut', 'Nafcr', 'ch_Nav
 cfg.LVACaMechs = ['Ca_LVAst', 'cat', 'catt', 'catcb']
 cfg.variables = ['gbar', 'gnafbar', 'gmax']  # Name of the variable/s to modify
 cfg.drugEffect = 0.5  # Multiplicative factor
+cfg.treatmentCellTypes = ['IT2_reduced', 'IT4_reduced', 'IT5A_reduced', 'IT5B_reduced', 'PT5B_reduced', 'IT6_reduced',
+                         'CT6_reduced', 'IT5A_full', 'PT5B_full']  # cell rules treated (missing rules are skipped)
+cfg.treatmentSecs = ['all']  # eg. ['soma', 'axon_0', 'axon_1']
+cfg.treatmentMechs = None  # mechs treated; None = cfg.sodiumMechs (eg. cfg.sodiumMechs + cfg.LVACaMechs)
+cfg.treatmentSelectors = None  # list of {'cellTypes', 'secs', 'mechs', 'variables'} dicts; overrides the above
+cfg.doseSchedule = []  # [[time (ms), drugEffect], ...] applied to the live cells during the run (dose-response)
+cfg.doseEpochTransient = 200.0  # ms excluded from the start of each dose epoch for the epoch pop rates
@@ -0,0 +1,171 @@
+"""
+connGen.py
+
+Vectorized generation of the local bin-based connectivity (E->E, E->I) from conn.pkl.
+
+With cfg.vectorizedConn, netParams.py stores one compact rule per connectivity label in
+netParams.binConnRules (ynorm bins plus the full probability and weight matrices) instead of
+one connParams rule per (preBin, postBin) pair. After the cells are created, addBinConnLists()
+samples all connections of each rule in a single seeded NumPy pass per population pair and
+adds them to netParams.connParams as explicit connList rules (with per-connection weight and
+delay = defaultDelay + dist_3D/propVelocity), so NetPyNE only instantiates the result.
+
+The random stream is seeded from cfg.seeds['conn'] and the rule/pop labels, so every rank
+generates the same connections independently of the number of ranks.
+
+Usage (instead of sim.net.connectCells()):
+    from connGen import connectCells
+    connectCells()
+
+connectCells() removes the generated connList rules again once the connections exist, so the
+saved netParams keeps the compact binConnRules rather than the per-node connection lists.
+With cfg.connSnapshot it first tries to create the conns from a saved snapshot (connSnapshot.py).
+"""
+
+import zlib
+
+import numpy as np
+
+# compact rule keys consumed here; all other keys are copied to the generated connParams rules
+binRuleKeys = ['preConds', 'postConds', 'preBins', 'postBins', 'probability', 'weight']
+
+
+# ------------------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------------------
+def _binMembers(values, bins):
+    """
+    (value index, bin index) arrays with an entry for every bin that contains each value. Bins are
+    matched as netpyne matches ynorm conds (lo <= value < hi); a value in several overlapping bins
+    belongs to each of them, as a cell matches the conds of several per-bin connParams rules.
+    """
+    bins = np.asarray(bins, dtype=float)
+    inBin = (values[:, None] >= bins[None, :, 0]) & (values[:, None] < bins[None, :, 1])
+    return np.nonzero(inBin)
+
+
+def _matchPops(pops, conds):
+    """ Labels of pops whose tags match all (non-spatial) conds """
+    matched = []
+    for popLabel, pop in pops.items():
+        match = True
+        for condKey, condValue in conds.items():
+            values = condValue if isinstance(condValue, list) else [condValue]
+            if pop.tags.get(condKey) not in values:
+                match = False
+        if match:
+            matched.append(popLabel)
+    return matched
+
+
+def _popArrays(allCellTags, popLabel):
+    """ Sorted gids and position arrays (ynorm, x, y, z) of the cells in a pop """
+    gids = np.array(sorted(gid for gid, tags in allCellTags.items() if tags.get('pop') == popLabel), dtype=int)
+    pos = {key: np.array([allCellTags[gid][key] for gid in gids], dtype=float) for key in ['ynorm', 'x', 'y', 'z']}
+    return gids, pos
+
+
+def sampleBinConns(rule, preGids, prePos, postGids, postPos, rng):
+    """
+    Sample connections between two pops for a compact bin rule.
+    Returns (preIndex, postIndex, weight) arrays; indices are relative to the sorted gid lists.
+    """
+    preCell, preBin = _binMembers(prePos['ynorm'], rule['preBins'])
+    postCell, postBin = _binMembers(postPos['ynorm'], rule['postBins'])
+    probMat = np.asarray(rule['probability'], dtype=float)
+    weightMat = np.asarray(rule['weight'], dtype=float)
+
+    # one draw per (post, pre) pair for each (postBin, preBin) rule both cells match; 0 for self conns
+    prob = probMat[np.ix_(postBin, preBin)]
+    prob[postGids[postCell][:, None] == preGids[preCell][None, :]] = 0.0
+
+    ipost, ipre = np.nonzero(rng.random(prob.shape) < prob)
+    weight = weightMat[postBin[ipost], preBin[ipre]]
+    return preCell[ipre], postCell[ipost], weight
+
+
+# ------------------------------------------------------------------------------
+# Expand compact rules into connList rules
+# ------------------------------------------------------------------------------
+def addBinConnLists(net=None):
+    """ Add explicit connList rules for netParams.binConnRules and the instantiated cells; returns their labels """
+    from netpyne import sim
+
+    net = net or sim.net
+    binConnRules = getattr(net.params, 'binConnRules', None)
+    if not binConnRules:
+        return []
+
+    sim.timing('start', 'connGenTime')
+    if sim.nhosts > 1:
+        allCellTags = sim._gatherAllCellTags()
+    else:
+        allCellTags = {cell.gid: cell.tags for cell in net.cells}
+
+    popArrays = {popLabel: _popArrays(allCellTags, popLabel) for popLabel in net.pops}
+    defaultDelay = net.params.defaultDelay
+    propVelocity = net.params.propVelocity
+
+    labels = []
+    numConns = 0
+    for ruleLabel, rule in binConnRules.items():
+        ruleParams = {k: v for k, v in rule.items() if k not in binRuleKeys}
+
+        for prePop in _matchPops(net.pops, rule['preConds']):
+            for postPop in _matchPops(net.pops, rule['postConds']):
+                preGids, prePos = popArrays[prePop]
+                postGids, postPos = popArrays[postPop]
+                if not len(preGids) or not len(postGids):
+                    continue
+
+                label = '%s_%s_%s' % (ruleLabel, prePop, postPop)
+                rng = np.random.default_rng([sim.cfg.seeds['conn'], zlib.crc32(label.encode())])
+                ipre, ipost, weight = sampleBinConns(rule, preGids, prePos, postGids, postPos, rng)
+
+                # keep only conns targeting cells in this node (indices stay relative to the full pop)
+                isLocal = np.isin(postGids, list(net.gid2lid))[ipost]
+                ipre, ipost, weight = ipre[isLocal], ipost[isLocal], weight[isLocal]
+                if not len(ipre):
+                    continue
+
+                dist = np.sqrt(sum((postPos[k][ipost] - prePos[k][ipre]) ** 2 for k in ['x', 'y', 'z']))
+                delay = defaultDelay + dist / propVelocity
+
+                net.params.connParams[label] = dict(ruleParams,
+                                                    preConds={'pop': prePop},
+                                                    postConds={'pop': postPop},
+                                                    connList=np.column_stack((ipre, ipost)).tolist(),
+                                                    weight=weight.tolist(),
+                                                    delay=delay.tolist())
+                labels.append(label)
+                numConns += len(ipre)
+
+    sim.timing('stop', 'connGenTime')
+    print('  Generated %d local bin-based connections on node %i (%.2f s)'
+          % (numConns, sim.rank, sim.timingData['connGenTime']))
+    return labels
+
+
+def connectCells():
+    """
+    sim.net.connectCells() with netParams.binConnRules expanded into connList rules.
+    With cfg.connSnapshot, reuses (or saves) the connectivity snapshot for this topology (see connSnapshot.py).
+    """
+    from netpyne import sim
+
+    if getattr(sim.cfg, 'connSnapshot', False) or getattr(sim.cfg, 'persistentWorker', False):
+        sim.cfg.includeParamsLabel = True  # conn rule labels are the weight classes (connSnapshot.py, batchWorker.py)
+    if getattr(sim.cfg, 'connSnapshot', False):
+        from connSnapshot import connectFromSnapshot
+        if connectFromSnapshot():
+            return [cell.conns for cell in sim.net.cells]
+
+    labels = addBinConnLists()
+    conns = sim.net.connectCells()
+    for label in labels:
+        del sim.net.params.connParams[label]
+
+    if getattr(sim.cfg, 'connSnapshot', False):
+        from connSnapshot import saveSnapshot
+        saveSnapshot()
+    return conns
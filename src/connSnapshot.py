@@ -0,0 +1,166 @@
+"""
+connSnapshot.py
+
+On-disk connectivity snapshot to reuse the wiring across weight-only batch trials.
+
+After the connections are created, each node saves its conns as a structured NumPy array
+(postGid, preGid, sec, loc, synMech, delay, weight, weightClass) plus a small json with the
+sec/synMech/weightClass tables. The snapshot folder is keyed by everything that determines the
+topology (cfg except weight-only fields, input files, seeds, number of nodes), so trials that
+only change EEGain, IEweights, IIweights, weightLong, etc. find the same snapshot. They load
+it memory-mapped, rescale the weights of each class (conn rule) by new/old rule weight and
+create the NetCons directly, skipping the conn rules altogether.
+
+Enabled with cfg.connSnapshot (used by connGen.connectCells(), which sets cfg.includeParamsLabel
+so that each conn keeps the label of its conn rule).
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from fileUtils import atomicWrite
+from netParamsCache import cacheKey, cacheExcludeFields
+
+# cfg fields that only scale connection weights (do not change which connections exist)
+weightOnlyFields = ['EEGain', 'EIGain', 'EPVGain', 'ESOMGain', 'IEGain', 'IIGain', 'PVEGain', 'SOMEGain', 'PVSOMGain',
+                    'SOMPVGain', 'SOMSOMGain', 'PVPVGain', 'IPTGain', 'IFullGain', 'IEweights', 'IIweights',
+                    'weightLong']
+
+# cfg fields excluded from the netParams cache key that do change the connectivity
+topologyFields = ['seeds', 'connRandomSecFromList', 'oneSynPerNetcon', 'allowSelfConns', 'balanceCells',
+                  'cellCostProfile', 'multisplit', 'multisplitParams']  # (the last four change which node holds each cell)
+
+connDtype = np.dtype([('postGid', 'i4'), ('preGid', 'i4'), ('sec', 'i4'), ('loc', 'f8'), ('synMech', 'i4'),
+                      ('delay', 'f8'), ('weight', 'f8'), ('weightClass', 'i4')])
+
+
+# ------------------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------------------
+def snapshotKey(cfg, nhosts):
+    """ Hash of everything that determines the topology on each node """
+    sha = hashlib.sha1()
+    sha.update(cacheKey(cfg, excludeFields=cacheExcludeFields + weightOnlyFields).encode())
+    sha.update(json.dumps({k: getattr(cfg, k, None) for k in topologyFields}, sort_keys=True).encode())
+    sha.update(str(nhosts).encode())
+    return sha.hexdigest()
+
+
+def ruleLabels(netParams):
+    """ Labels of all conn rules (connParams and compact binConnRules) """
+    return sorted(list(netParams.connParams.keys()) + list(getattr(netParams, 'binConnRules', {}).keys()))
+
+
+def ruleWeightScale(netParams, label):
+    """ Overall weight scale of the conn rule that created conns with this label (None if not numeric) """
+    rule = netParams.connParams.get(label)
+    if rule is None:  # connList rules generated from binConnRules (see connGen.py) are named <rule>_<prePop>_<postPop>
+        rule = getattr(netParams, 'binConnRules', {}).get(label.rsplit('_', 2)[0])
+    try:
+        return float(np.sum(np.abs(np.asarray(rule['weight'], dtype=float))))
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def _classFactors(meta, netParams):
+    """ Weight factor of each class for the current netParams (None if the snapshot does not apply) """
+    if meta['ruleLabels'] != ruleLabels(netParams):
+        return None
+    factors = []
+    for label, oldScale in zip(meta['weightClasses'], meta['classScales']):
+        newScale = ruleWeightScale(netParams, label)
+        if oldScale is None or newScale is None:
+            return None
+        if oldScale == 0.0:
+            if newScale != 0.0:
+                return None  # cannot rescale weights saved as 0
+            factors.append(1.0)
+        else:
+            factors.append(newScale / oldScale)
+    return np.array(factors)
+
+
+def _fileName(cfg):
+    from netpyne import sim
+    folder = os.path.join(cfg.connSnapshotFolder, snapshotKey(cfg, sim.nhosts))
+    return os.path.join(folder, 'node%dof%d' % (sim.rank, sim.nhosts))
+
+
+# ------------------------------------------------------------------------------
+# Save / load
+# ------------------------------------------------------------------------------
+def saveSnapshot():
+    """ Save the conns of this node (call after connecting cells, before adding stims) """
+    from netpyne import sim
+
+    fileName = _fileName(sim.cfg)
+    if os.path.exists(fileName + '.npy'):
+        return
+
+    secs, synMechs, weightClasses = {}, {}, {}
+    rows = []
+    for cell in sim.net.cells:
+        for conn in cell.conns:
+            if not isinstance(conn.get('preGid'), (int, np.integer)):
+                continue  # NetStim conns are created by addStims
+            if 'label' not in conn:
+                raise ValueError('Conn of cell %d has no conn rule label; the snapshot requires cfg.includeParamsLabel'
+                                 % cell.gid)
+            rows.append((cell.gid, conn['preGid'], secs.setdefault(conn['sec'], len(secs)), conn['loc'],
+                         synMechs.setdefault(conn['synMech'], len(synMechs)), conn['delay'], conn['weight'],
+                         weightClasses.setdefault(conn['label'], len(weightClasses))))
+
+    meta = {'secs': list(secs), 'synMechs': list(synMechs), 'weightClasses': list(weightClasses),
+            'classScales': [ruleWeightScale(sim.net.params, label) for label in weightClasses],
+            'ruleLabels': ruleLabels(sim.net.params)}
+
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    with atomicWrite(fileName + '.json', 'w') as fileObj:
+        json.dump(meta, fileObj)
+    with atomicWrite(fileName + '.npy', 'wb') as fileObj:  # written last: marks the snapshot as complete
+        np.save(fileObj, np.array(rows, dtype=connDtype))
+    print('  Saved connectivity snapshot of node %i (%d conns) to %s' % (sim.rank, len(rows), fileName))
+
+
+def connectFromSnapshot():
+    """ Create the conns of this node from a matching snapshot; returns False (on all nodes) if unavailable """
+    from netpyne import sim
+    from netpyne.specs import Dict
+
+    fileName = _fileName(sim.cfg)
+    factors = None
+    if os.path.exists(fileName + '.npy'):
+        with open(fileName + '.json', 'r') as fileObj:
+            meta = json.load(fileObj)
+        factors = _classFactors(meta, sim.net.params)
+
+    if not sim.pc.allreduce(1 if factors is not None else 0, 3):  # min over nodes: all use it or none does
+        return False
+
+    sim.timing('start', 'connectTime')
+    if sim.rank == 0:
+        print('Making connections from snapshot %s ...' % os.path.dirname(fileName))
+
+    conns = np.load(fileName + '.npy', mmap_mode='r')
+    weights = conns['weight'] * factors[conns['weightClass']] if len(conns) else np.zeros(0)
+    secs, synMechs, weightClasses = meta['secs'], meta['synMechs'], meta['weightClasses']
+
+    for (postGid, preGid, sec, loc, synMech, delay, _, weightClass), weight in zip(conns.tolist(), weights.tolist()):
+        cell = sim.net.cells[sim.net.gid2lid[postGid]]
+        cell.conns.append(Dict({'preGid': preGid, 'sec': secs[sec], 'loc': loc, 'synMech': synMechs[synMech],
+                                'weight': weight, 'delay': delay, 'label': weightClasses[weightClass]}))
+
+    if sim.cfg.createNEURONObj:
+        for cell in sim.net.cells:
+            if cell.conns:
+                cell.addConnsNEURONObj()
+
+    print('  Number of synaptic contacts on node %i: %i ' % (sim.rank, len(conns)))
+    sim.pc.barrier()
+    sim.timing('stop', 'connectTime')
+    if sim.rank == 0 and sim.cfg.timing:
+        print('  Done; cell connection time = %0.2f s.' % sim.timingData['connectTime'])
+    return True
@@ -0,0 +1,257 @@
+"""
+dataStream.py
+
+Per-rank output shards of spikes, traces and cell tags, optionally streamed during the run.
+
+Each rank writes its own shard; nothing goes through rank 0 except a small manifest:
+
+    <saveFolder>/<simLabel>_data/
+        manifest.json          (rank 0) simLabel, nhosts, duration, saveInterval, recordStep, traces, pops, nodes
+                               (+ doseEpochs: pop rates of each dose epoch, with cfg.doseSchedule)
+        node<rank>/
+            cells.npy          cell tags of this rank (gid, pop index, x, y, z, xnorm, ynorm, znorm)
+            spkt.f8, spkid.i4  spike times and gids, appended (columnar raw arrays)
+            <trace>.f4         trace samples, appended as (samples, cells) rows of float32
+            index.json         gids of each trace + cumulative spike/sample counts of each chunk
+
+With cfg.streamData, every cfg.saveInterval ms (NEURON events, no synchronization between ranks)
+each rank appends the spikes and trace samples recorded since the last chunk and clears the
+recording vectors, so memory stays flat and a crash only loses the last interval. With
+cfg.saveShards only, each rank writes a single chunk at the end of the run (no gather).
+
+index.json is rewritten atomically after each chunk and only lists data already on disk, so
+readers use its last entry as the valid length of every file.
+
+Usage (init.py with cfg.streamData or cfg.saveShards; replaces gatherData/saveData of simData):
+    dataStream = DataStream()   # after sim.setupRecording()
+    sim.runSim()
+    dataStream.close()
+
+Analysis (shards are memory-mapped, nothing is read until used):
+    data = openDataset('../data/v56/v56_Optuna6_74aee313_data')
+    spkt, spkid = data.spikes(trange=[1000, 5000])
+    vsoma = data.trace('V_soma', gid)
+"""
+
+import json
+import os
+
+import numpy as np
+
+from fileUtils import atomicWrite
+
+spikeFiles = {'spkt': 'f8', 'spkid': 'i4'}
+traceDtype = 'f4'
+cellDtype = np.dtype([('gid', 'i4'), ('pop', 'i2'), ('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
+                      ('xnorm', 'f4'), ('ynorm', 'f4'), ('znorm', 'f4')])
+
+
+def _writeJson(fileName, data):
+    with atomicWrite(fileName, 'w') as fileObj:
+        json.dump(data, fileObj)
+
+
+def dataFolder(cfg):
+    return os.path.join(cfg.saveFolder, cfg.simLabel + '_data')
+
+
+class DataStream(object):
+    """ Shard writer of this rank: cell tags at setup, spikes/traces every cfg.saveInterval ms (cfg.streamData) and at close() """
+
+    def __init__(self, cfg=None):
+        from neuron import h
+        from netpyne import sim
+
+        self.cfg = cfg or sim.cfg
+        self.folder = dataFolder(self.cfg)
+        self.nodeFolder = os.path.join(self.folder, 'node%d' % sim.rank)
+        os.makedirs(self.nodeFolder, exist_ok=True)
+
+        # trace vectors of this rank: {trace: [(gid, h.Vector)]}
+        self.traces = {}
+        for trace in self.cfg.recordTraces:
+            vectors = sim.simData.get(trace, {})
+            self.traces[trace] = sorted((int(key.split('_')[-1]), vec) for key, vec in vectors.items()
+                                        if key.startswith('cell_'))
+
+        pops = list(sim.net.pops)
+        self.saveCells(pops)
+        self.manifest = {'simLabel': self.cfg.simLabel, 'nhosts': sim.nhosts, 'duration': self.cfg.duration,
+                         'saveInterval': self.cfg.saveInterval if self.cfg.streamData else None,
+                         'recordStep': self.cfg.recordStep, 'traces': list(self.traces), 'pops': pops,
+                         'spikeFiles': spikeFiles, 'traceDtype': traceDtype,
+                         'nodes': ['node%d' % rank for rank in range(sim.nhosts)]}
+        self.updateManifest()
+
+        self.handler = h.FInitializeHandler(self.queueEvents)  # on every (re)initialization
+
+    def saveCells(self, pops):
+        """ Write the tags of the cells of this rank """
+        from netpyne import sim
+
+        popIndex = {pop: i for i, pop in enumerate(pops)}
+        cells = np.array([(cell.gid, popIndex[cell.tags['pop']]) + tuple(cell.tags.get(k, np.nan) for k in
+                                                                           cellDtype.names[2:])
+                          for cell in sim.net.cells], dtype=cellDtype)
+        np.save(os.path.join(self.nodeFolder, 'cells.npy'), cells)
+
+    def updateManifest(self, **fields):
+        """ Add fields (e.g. results of the run) to the manifest (written by rank 0) """
+        from netpyne import sim
+
+        self.manifest.update(fields)
+        if sim.rank == 0:
+            _writeJson(os.path.join(self.folder, 'manifest.json'), self.manifest)
+
+    def queueEvents(self):
+        """ Start new files and queue one cvode event per save interval (if streaming) """
+        from netpyne import sim
+
+        for fileName in list(spikeFiles) + list(self.traces):
+            open(self._fileName(fileName), 'wb').close()
+        self.index = {'gids': {trace: [gid for gid, _ in vecs] for trace, vecs in self.traces.items()},
+                      'chunks': []}
+        self.numSpikes = 0
+        self.numSamples = {trace: 0 for trace in self.traces}
+        self._writeIndex()
+
+        if not self.cfg.streamData:
+            return
+        for t in np.arange(self.cfg.saveInterval, self.cfg.duration, self.cfg.saveInterval):
+            sim.cvode.event(float(t), lambda t=float(t): self.flush(t))  # h.cvode needs stdrun.hoc
+
+    def _fileName(self, name):
+        dtype = spikeFiles.get(name, traceDtype)
+        return os.path.join(self.nodeFolder, '%s.%s' % (name, dtype))
+
+    def _writeIndex(self):
+        _writeJson(os.path.join(self.nodeFolder, 'index.json'), self.index)
+
+    def flush(self, t):
+        """ Append spikes and trace samples recorded so far and clear the recording vectors """
+        from netpyne import sim
+
+        spkt, spkid = sim.simData['spkt'], sim.simData['spkid']
+        numSpikes = min(len(spkt), len(spkid))
+        with open(self._fileName('spkt'), 'ab') as fileObj:
+            np.asarray(spkt.as_numpy()[:numSpikes], dtype=spikeFiles['spkt']).tofile(fileObj)
+        with open(self._fileName('spkid'), 'ab') as fileObj:
+            np.asarray(spkid.as_numpy()[:numSpikes], dtype=spikeFiles['spkid']).tofile(fileObj)
+        spkt.resize(0)
+        spkid.resize(0)
+        self.numSpikes += numSpikes
+
+        for trace, vecs in self.traces.items():
+            if not vecs:
+                continue
+            numSamples = min(len(vec) for _, vec in vecs)  # complete rows only; the rest goes in the next chunk
+            if not numSamples:
+                continue
+            rows = np.column_stack([vec.as_numpy()[:numSamples] for _, vec in vecs]).astype(traceDtype)
+            with open(self._fileName(trace), 'ab') as fileObj:
+                rows.tofile(fileObj)
+            for _, vec in vecs:
+                vec.remove(0, numSamples - 1)
+            self.numSamples[trace] += numSamples
+
+        self.index['chunks'].append({'t': t, 'numSpikes': self.numSpikes, 'numSamples': dict(self.numSamples)})
+        self._writeIndex()
+
+    def localSpikes(self):
+        """ (spkt, spkid) written by this rank so far (all of the run after close) """
+        return tuple(np.fromfile(self._fileName(name), dtype=dtype, count=self.numSpikes)
+                     for name, dtype in spikeFiles.items())
+
+    def close(self):
+        """ Write the last chunk (call after the run) """
+        from netpyne import sim
+
+        self.flush(float(self.cfg.duration))
+        self.handler = None  # final: a later initialization (e.g. another sim in this process) does not truncate the shard
+        if sim.rank == 0:
+            print('  Saved spikes, traces and cells of %d ranks to %s' % (sim.nhosts, self.folder))
+
+
+# ------------------------------------------------------------------------------
+# Read
+# ------------------------------------------------------------------------------
+class Dataset(object):
+    """ All shards of a run as one dataset; shard files are memory-mapped on first use """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'manifest.json'), 'r') as fileObj:
+            self.manifest = json.load(fileObj)
+        self.pops = self.manifest['pops']
+        self.nodes = self.manifest['nodes']
+        self._shards = {}
+
+    def shard(self, node):
+        """ Memory-mapped arrays of one shard, cut to the last complete chunk in its index """
+        if node not in self._shards:
+            nodeFolder = os.path.join(self.folder, node)
+            with open(os.path.join(nodeFolder, 'index.json'), 'r') as fileObj:
+                index = json.load(fileObj)
+            last = index['chunks'][-1] if index['chunks'] else {'numSpikes': 0, 'numSamples': {}}
+
+            def mapFile(name, dtype, count, shape=None):
+                fileName = os.path.join(nodeFolder, '%s.%s' % (name, dtype))
+                if not count:
+                    return np.zeros((0,) + tuple(shape or ()), dtype=dtype)
+                data = np.memmap(fileName, dtype=dtype, mode='r', shape=(count * int(np.prod(shape or [1])),))
+                return data.reshape((count,) + tuple(shape)) if shape else data
+
+            shard = {'cells': np.load(os.path.join(nodeFolder, 'cells.npy'), mmap_mode='r'),
+                     'gids': index['gids'], 'chunks': index['chunks']}
+            for name, dtype in self.manifest['spikeFiles'].items():
+                shard[name] = mapFile(name, dtype, last['numSpikes'])
+            for trace, gids in index['gids'].items():
+                shard[trace] = mapFile(trace, self.manifest['traceDtype'], last['numSamples'].get(trace, 0),
+                                       [len(gids)])
+            self._shards[node] = shard
+        return self._shards[node]
+
+    @property
+    def cells(self):
+        """ Tags of all cells, sorted by gid """
+        cells = np.concatenate([self.shard(node)['cells'] for node in self.nodes])
+        return cells[np.argsort(cells['gid'])]
+
+    def spikes(self, trange=None, gids=None):
+        """ (spkt, spkid) of all shards, optionally only in trange [start, stop) and for gids """
+        spkt, spkid = [], []
+        for node in self.nodes:
+            shard = self.shard(node)
+            select = np.ones(len(shard['spkt']), dtype=bool)
+            if trange is not None:
+                select &= (shard['spkt'] >= trange[0]) & (shard['spkt'] < trange[1])
+            if gids is not None:
+                select &= np.isin(shard['spkid'], gids)
+            spkt.append(shard['spkt'][select])
+            spkid.append(shard['spkid'][select])
+        spkt, spkid = np.concatenate(spkt), np.concatenate(spkid)
+        order = np.argsort(spkt, kind='stable')
+        return spkt[order], spkid[order]
+
+    def trace(self, trace, gid):
+        """ Samples of trace for cell gid (a view into the memory-mapped shard) """
+        for node in self.nodes:
+            shard = self.shard(node)
+            if gid in shard['gids'].get(trace, []):
+                return shard[trace][:, shard['gids'][trace].index(gid)]
+        raise KeyError('No %s trace recorded for cell %d' % (trace, gid))
+
+    def popRates(self, trange):
+        """ Average rate (Hz) of each pop in trange [start, stop) """
+        cells = self.cells
+        _, spkid = self.spikes(trange)
+        spikePops = cells['pop'][np.searchsorted(cells['gid'], spkid)]
+        counts = np.bincount(spikePops, minlength=len(self.pops))
+        numCells = np.bincount(cells['pop'], minlength=len(self.pops))
+        duration = (trange[1] - trange[0]) / 1000.0
+        return {pop: counts[i] / numCells[i] / duration for i, pop in enumerate(self.pops) if numCells[i]}
+
+
+def openDataset(folder):
+    """ Dataset of the shards in folder (see Dataset) """
+    return Dataset(folder)
@@ -0,0 +1,280 @@
+"""
+drugTreatment.py
+
+Vectorized drug treatment: scaling of channel parameters (e.g. Na conductances) in cell rules
+and in live cells.
+
+A treatment is a list of selectors:
+    {'cellTypes': [cell rule labels] or ['all'], 'secs': [sec names] or ['all'],
+     'mechs': [mech names], 'variables': [mech param names]}
+The selected params are resolved once into a columnar view (one flat float array plus the slice
+of each param), scaled in a single NumPy operation and written back, instead of walking
+secs/mechs/vars and converting every value to an array and back per cell type.
+
+Cell rules that do not exist (e.g. not used by any population) are simply not selected.
+
+Cell rules (netParams.py):
+    scaleRules(netParams.cellParams, treatmentSelectors(cfg), cfg.drugEffect)
+
+The dose the rules were built with is kept in netParams.treatmentParams, so a cached build can be
+rescaled to a new cfg.drugEffect without rebuilding (see netParamsCache.py).
+
+Live cells (e.g. from a callback during the simulation):
+    index = indexCells(treatmentSelectors(cfg))
+    setCellsFactor(index, 0.25)   # selected params = 0.25 x their values when indexed
+
+Dose-response within one simulation: cfg.doseSchedule = [[time (ms), drugEffect], ...] sets the
+treated params of the live cells to each drugEffect at its time (scheduleDoses(), after the cells
+exist), and epochRates() returns the pop rates of each dose epoch after gatherData() (reduceEpochRates()
+without it, e.g. for per-rank shards).
+"""
+
+import numpy as np
+
+# tags compared as [min, max] ranges in cell rule conds (as in NetPyNE)
+rangeTags = ['x', 'y', 'z', 'xnorm', 'ynorm', 'znorm']
+
+
+# ------------------------------------------------------------------------------
+# Selectors
+# ------------------------------------------------------------------------------
+def treatmentSelectors(cfg):
+    """ Treatment selectors from cfg (cfg.treatmentSelectors, or cell types/secs x treated mechs x cfg.variables) """
+    if getattr(cfg, 'treatmentSelectors', None):
+        return cfg.treatmentSelectors
+    return [{'cellTypes': cfg.treatmentCellTypes, 'secs': cfg.treatmentSecs,
+             'mechs': getattr(cfg, 'treatmentMechs', None) or cfg.sodiumMechs, 'variables': cfg.variables}]
+
+
+def _selected(name, names):
+    return 'all' in names or name in names
+
+
+def paramRefs(secs, selectors, refs=None, seen=None):
+    """ Append (sec, mechName, varName) of the params in secs selected by any of selectors (each param once) """
+    refs = [] if refs is None else refs
+    seen = set() if seen is None else seen
+    for selector in selectors:
+        for secName, sec in secs.items():
+            if not _selected(secName, selector['secs']):
+                continue
+            for mechName, mech in sec.get('mechs', {}).items():
+                if mechName not in selector['mechs']:
+                    continue
+                for varName in mech:
+                    key = (id(sec), mechName, varName)
+                    if varName in selector['variables'] and key not in seen:
+                        seen.add(key)
+                        refs.append((sec, mechName, varName))
+    return refs
+
+
+def ruleRefs(cellParams, selectors):
+    """ Selected params of the cell rules (rules not in cellParams or kept in a cellStore are skipped) """
+    refs, seen = [], set()
+    for label, rule in cellParams.items():
+        ruleSelectors = [s for s in selectors if _selected(label, s['cellTypes'])]
+        if ruleSelectors and 'secs' in rule:
+            paramRefs(rule['secs'], ruleSelectors, refs, seen)
+    return refs
+
+
+# ------------------------------------------------------------------------------
+# Columnar view
+# ------------------------------------------------------------------------------
+def columnarView(refs):
+    """ Flat float array with the values of all refs and the (start, stop, isList) slice of each """
+    values, slices = [], []
+    for sec, mechName, varName in refs:
+        value = sec['mechs'][mechName][varName]
+        isList = isinstance(value, (list, tuple, np.ndarray))
+        vals = list(value) if isList else [value]
+        slices.append((len(values), len(values) + len(vals), isList))
+        values.extend(vals)
+    return np.array(values, dtype=float), slices
+
+
+def writeView(refs, slices, values):
+    """ Write the values of a columnar view back to the params (lists stay lists, as NetPyNE requires) """
+    for (sec, mechName, varName), (start, stop, isList) in zip(refs, slices):
+        sec['mechs'][mechName][varName] = values[start:stop].tolist() if isList else float(values[start])
+
+
+# ------------------------------------------------------------------------------
+# Cell rules
+# ------------------------------------------------------------------------------
+def scaleRules(cellParams, selectors, factor):
+    """ Multiply the selected cell rule params by factor; returns the number of values scaled """
+    refs = ruleRefs(cellParams, selectors)
+    values, slices = columnarView(refs)
+    writeView(refs, slices, values * factor)
+    return len(values)
+
+
+def setRuleDose(cellParams, treatmentParams, dose):
+    """
+    Rescale rules treated with treatmentParams['dose'] (see netParams.py) to dose.
+    Returns False if not possible (built with dose 0, or treated rules kept in a cellStore).
+    """
+    if dose == treatmentParams['dose']:
+        return True
+    if treatmentParams['dose'] == 0.0:
+        return False
+    for label, rule in cellParams.items():
+        if 'secs' not in rule and any(_selected(label, s['cellTypes']) for s in treatmentParams['selectors']):
+            return False
+    scaleRules(cellParams, treatmentParams['selectors'], dose / treatmentParams['dose'])
+    treatmentParams['dose'] = dose
+    return True
+
+
+# ------------------------------------------------------------------------------
+# Live cells
+# ------------------------------------------------------------------------------
+def _matchConds(tags, conds):
+    """ True if cell tags match cell rule conds (same rules as NetPyNE) """
+    for key, value in conds.items():
+        if key in rangeTags:
+            if key not in tags or not value[0] <= tags[key] <= value[1]:
+                return False
+        elif isinstance(value, list):
+            if tags.get(key) not in value:
+                return False
+        elif tags.get(key) != value:
+            return False
+    return True
+
+
+def indexCells(selectors, cells=None, cellParams=None):
+    """
+    Index of the selected params of live cells (this rank): Python-side refs and pointers to the
+    NEURON segment values, with their current values. Build once, then setCellsFactor() as needed.
+    """
+    from netpyne import sim
+
+    cells = sim.net.cells + getattr(sim.net, 'splitPieces', []) if cells is None else cells
+    cellParams = sim.net.params.cellParams if cellParams is None else cellParams
+
+    refs, seen = [], set()
+    for cell in cells:
+        labels = [label for label, rule in cellParams.items() if _matchConds(cell.tags, rule.get('conds', {}))]
+        cellSelectors = [s for s in selectors if any(_selected(label, s['cellTypes']) for label in labels)]
+        if cellSelectors and getattr(cell, 'secs', None):
+            paramRefs(cell.secs, cellSelectors, refs, seen)
+
+    return indexRefs(refs)
+
+
+def indexRefs(refs):
+    """ Index of live cell params: columnar view of the Python-side values plus pointers to the NEURON segment values """
+    pyValues, pySlices = columnarView(refs)
+    pointers = []
+    for sec, mechName, varName in refs:
+        if 'hObj' in sec:
+            pointers.extend(getattr(getattr(seg, mechName), '_ref_' + varName) for seg in sec['hObj'])
+    segValues = np.array([pointer[0] for pointer in pointers], dtype=float)
+
+    return {'refs': refs, 'pySlices': pySlices, 'pyValues': pyValues, 'pointers': pointers, 'segValues': segValues}
+
+
+def setCellsFactor(index, factor, reinit=True, updatePy=True):
+    """ Set the indexed params of the live cells to factor x their values when indexed """
+    from netpyne import sim
+
+    if updatePy:  # Python-side cell.secs (only needed if cell secs are saved or inspected)
+        writeView(index['refs'], index['pySlices'], index['pyValues'] * factor)
+    for pointer, value in zip(index['pointers'], (index['segValues'] * factor).tolist()):
+        pointer[0] = value
+    if reinit and sim.cfg.cvode_active:
+        sim.cvode.re_init()  # params changed during the run (h.cvode needs stdrun.hoc)
+
+
+# ------------------------------------------------------------------------------
+# Dose schedule (dose-response within one simulation)
+# ------------------------------------------------------------------------------
+def _buildDose(cfg):
+    """ drugEffect the cells were built with (1.0 = untreated) """
+    return cfg.drugEffect if cfg.treatment else 1.0
+
+
+def doseEpochs(cfg):
+    """ [(start, stop, drugEffect)] of cfg.doseSchedule; before the first scheduled time cells keep the build dose """
+    schedule = sorted([float(t), dose] for t, dose in cfg.doseSchedule)
+    epochs = [(0.0, schedule[0][0] if schedule else float(cfg.duration), _buildDose(cfg))]
+    for i, (t, dose) in enumerate(schedule):
+        stop = schedule[i + 1][0] if i + 1 < len(schedule) else float(cfg.duration)
+        epochs.append((t, stop, dose))
+    return [(start, min(stop, float(cfg.duration)), dose) for start, stop, dose in epochs if start < min(stop, cfg.duration)]
+
+
+def scheduleDoses(cfg=None):
+    """ Set the treated params of the live cells to each drugEffect of cfg.doseSchedule at its time (all ranks) """
+    from neuron import h
+    from netpyne import sim
+
+    cfg = cfg or sim.cfg
+    buildDose = _buildDose(cfg)
+    if buildDose == 0.0:
+        raise ValueError('Cannot schedule doses for cells built with drugEffect=0')
+    index = indexCells(treatmentSelectors(cfg))
+
+    def setDose(dose):
+        if sim.rank == 0:
+            print('  t = %0.1f ms: drugEffect = %s' % (h.t, dose))
+        setCellsFactor(index, dose / buildDose)
+
+    def queueDoses():
+        setCellsFactor(index, 1.0, reinit=False)  # back to the build dose on every (re)initialization
+        for t, dose in cfg.doseSchedule:
+            sim.cvode.event(float(t), lambda dose=dose: setDose(dose))  # h.cvode needs stdrun.hoc
+
+    sim.doseHandler = h.FInitializeHandler(queueDoses)  # keep a reference while the handler is needed
+    return index
+
+
+def _epochRanges(cfg):
+    """ [(start, stop, drugEffect)] of the dose epochs without their first cfg.doseEpochTransient ms """
+    return [(min(start + cfg.doseEpochTransient, stop), stop, dose) for start, stop, dose in doseEpochs(cfg)]
+
+
+def epochRates(cfg=None):
+    """ Pop rates (Hz) in each dose epoch, excluding the first cfg.doseEpochTransient ms (rank 0, after gatherData) """
+    from netpyne import sim
+
+    cfg = cfg or sim.cfg
+    spkt = np.array(sim.allSimData['spkt'], dtype=float)
+    spkid = np.array(sim.allSimData['spkid'], dtype=int)
+
+    epochs = []
+    for start, stop, dose in _epochRanges(cfg):
+        inEpoch = spkid[(spkt >= start) & (spkt < stop)]
+        popRates = {}
+        for popLabel, pop in sim.net.allPops.items():
+            gids = pop.get('cellGids', [])
+            if len(gids) and stop > start:
+                popRates[popLabel] = float(np.isin(inEpoch, gids).sum()) / len(gids) / ((stop - start) / 1000.0)
+        epochs.append({'start': start, 'stop': stop, 'drugEffect': dose, 'popRates': popRates})
+    return epochs
+
+
+def reduceEpochRates(cfg=None, spikes=None):
+    """
+    epochRates() without gatherData: spike counts of the cells of each rank (spikes: (spkt, spkid) of
+    this rank, default sim.simData) summed with one allreduce (all ranks)
+    """
+    from netpyne import sim
+    from popRates import allreduceSum, localSpikePops
+
+    cfg = cfg or sim.cfg
+    pops = list(sim.net.pops)
+    ranges = _epochRanges(cfg)
+    spkt, spikePops, numCells = localSpikePops(pops, spikes)
+    counts = np.zeros((len(pops), len(ranges)))
+    for i, (start, stop, _) in enumerate(ranges):
+        counts[:, i] = np.bincount(spikePops[(spkt >= start) & (spkt < stop)], minlength=len(pops))
+    counts, numCells = allreduceSum(counts, numCells)
+
+    return [{'start': start, 'stop': stop, 'drugEffect': dose,
+             'popRates': {pop: float(counts[j, i]) / numCells[j] / ((stop - start) / 1000.0)
+                          for j, pop in enumerate(pops) if numCells[j] and stop > start}}
+            for i, (start, stop, dose) in enumerate(ranges)]
@@ -0,0 +1,53 @@
+"""
+fileUtils.py
+
+Atomic writes of cache, store and output files.
+
+Files and folders that other ranks or concurrent trials may read while they are being written
+(netParams cache, cell store, conn snapshots, params store, shard manifests) are written to a
+temp name (<name>.<pid>.tmp) and renamed into place when complete, so readers only ever see
+the whole file or no file.
+
+Usage:
+    with atomicWrite(fileName, 'wb') as fileObj:
+        pickle.dump(data, fileObj)
+    with atomicWrite(fileName, 'wb', opener=gzip.open, compresslevel=6) as fileObj: ...
+    with atomicFolder(folder) as tmpFolder:
+        np.save(os.path.join(tmpFolder, 'values.npy'), values)
+"""
+
+import contextlib
+import os
+import shutil
+
+
+def _tmpName(name):
+    return '%s.%d.tmp' % (name, os.getpid())
+
+
+@contextlib.contextmanager
+def atomicWrite(fileName, mode='w', opener=open, **kwargs):
+    """ File object of a temp file, renamed to fileName (replacing it) on success and removed on error """
+    tmpFile = _tmpName(fileName)
+    try:
+        with opener(tmpFile, mode, **kwargs) as fileObj:
+            yield fileObj
+        os.replace(tmpFile, fileName)
+    finally:
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+
+
+@contextlib.contextmanager
+def atomicFolder(folder):
+    """ Path of a temp folder, renamed to folder on success; discarded if folder was written meanwhile or on error """
+    tmpFolder = _tmpName(folder)
+    os.makedirs(tmpFolder, exist_ok=True)
+    try:
+        yield tmpFolder
+        os.rename(tmpFolder, folder)
+    except OSError:
+        if not os.path.isdir(folder):
+            raise
+    finally:
+        shutil.rmtree(tmpFolder, ignore_errors=True)
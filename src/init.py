@@ -15,73 +15,67 @@ Contributors: salvadordura@gmail.com
 import matplotlib; matplotlib.use('Agg')  # to avoid graphics error in servers
 from netpyne import sim
 
-#------------------------------------------------------------------------------
-## Function to modify cell params during sim (e.g. modify PT ih)
-def modifyMechsFunc(simTime):
-    from netpyne import sim
-
-    t = simTime
-
-    cellType = cfg.modifyMechs['cellType']
-    mech = cfg.modifyMechs['mech']
-    prop = cfg.modifyMechs['property']
-    newFactor = cfg.modifyMechs['newFactor']
-    origFactor = cfg.modifyMechs['origFactor']
-    factor = newFactor / origFactor
-    change = False
-
-    if cfg.modifyMechs['endTime']-1.0 <= t <= cfg.modifyMechs['endTime']+1.0:
-        factor = origFactor / newFactor if abs(newFactor) > 0.0 else origFactor
-        change = True
-
-    elif t >= cfg.modifyMechs['startTime']-1.0 <= t <= cfg.modifyMechs['startTime']+1.0:
-        factor = newFactor / origFactor if abs(origFactor) > 0.0 else newFactor
-        change = True
-
-    if change:
-        print('   Modifying %s %s %s by a factor of %f' % (cellType, mech, prop, factor))
-        for cell in sim.net.cells:
-            if 'cellType' in cell.tags and cell.tags['cellType'] == cellType:
-                for secName, sec in cell.secs.items():
-                    if mech in sec['mechs'] and prop in sec['mechs'][mech]:
-                        # modify python
-                        sec['mechs'][mech][prop] = [g * factor for g in sec['mechs'][mech][prop]] if isinstance(sec['mechs'][mech][prop], list) else sec['mechs'][mech][prop] * factor
-
-                        # modify neuron
-                        for iseg, seg in enumerate(sec['hObj']):  # set mech params for each segment
-                            if sim.cfg.verbose: print('   Modifying %s %s %s by a factor of %f' % (secName, mech, prop, factor))
-                            setattr(getattr(seg, mech), prop, getattr(getattr(seg, mech), prop) * factor)
-
-
-
 # -----------------------------------------------------------
 # Main code
-cfg, netParams = sim.readCmdLineArgs(simConfigDefault='cfg.py', netParamsDefault='netParams.py')
+from netParamsCache import readCmdLineArgs
+from connGen import connectCells
+from cellStore import createCells
+from loadBalance import balancePops, printImbalance
+from drugTreatment import scheduleDoses, epochRates, reduceEpochRates
+from mechSchedule import MechSchedule, mechChanges
+from dataStream import DataStream
+from paramStore import saveCompact
+from multiSplit import splitPops, splitCells
+cfg, netParams = readCmdLineArgs(simConfigDefault='cfg.py', netParamsDefault='netParams.py')  # build netParams or load identical build from cache
 sim.initialize(
     simConfig = cfg, 	
     netParams = netParams)  # create network object and set cfg and net params
 
 sim.pc.timeout(300)                          # set nrn_timeout threshold to X sec (max time allowed without increasing simulation time, t; 0 = turn off)
 sim.net.createPops()               			# instantiate network populations
-sim.net.createCells()              			# instantiate network cells based on defined populations
-sim.net.connectCells()            			# create connections between cells based on params
+if cfg.balanceCells: balancer = balancePops()  # cost-aware distribution of cells across ranks (loadBalance.py)
+if cfg.multisplit: splitPops()            	# create PT5B_full cells on several ranks, in pieces (multiSplit.py)
+createCells()                      			# instantiate network cells based on defined populations (cellStore.py)
+if cfg.balanceCells: printImbalance(balancer)  # estimated max/mean load of the ranks
+connectCells()                    			# create connections between cells based on params (connGen.py)
 sim.net.addStims() 							# add network stimulation
+if cfg.multisplit: splitCells()           	# split PT5B_full cells across ranks/threads (multiSplit.py)
 sim.setupRecording()              			# setup variables to record for each cell (spikes, V traces, etc)
-
-# Simulation option 1: standard
-# sim.runSim()                              # run parallel Neuron simulation (calling func to modify mechs)
+if cfg.doseSchedule: scheduleDoses()      	# change drugEffect on the live cells at the scheduled times
+saveShards = cfg.streamData or cfg.saveShards or cfg.outputProfile == 'compact'
+if saveShards:
+    dataStream = DataStream()              	# per-rank shards of spikes/traces/cells, streamed if cfg.streamData (dataStream.py)
 
 print(cfg.modifyMechs)
-# Simulation option 2: interval function to modify mechanism params
-sim.runSimWithIntervalFunc(1000.0, modifyMechsFunc)       # run parallel Neuron simulation (calling func to modify mechs)
-
-# Gather/save data option 1: standard
-sim.gatherData()
-
-# Gather/save data option 2: distributed saving across nodes 
-#sim.saveDataInNodes()
-#sim.gatherDataFromFiles()
-
-sim.saveData()                    			# save params, cell info and sim output to file (pickle,mat,txt,etc)#
-sim.analysis.plotData()         			# plot spike raster etc
-
+mechSchedule = MechSchedule(mechChanges(cfg))  # mech changes (cfg.modifyMechs + cfg.modifyMechsExtra) as NEURON events (mechSchedule.py)
+
+# Simulation option 1: standard (scheduled mech changes are delivered as events, only at their times)
+sim.runSim()                              	# run parallel Neuron simulation
+
+# Simulation option 2: interval function (eg. to monitor or modify the network every X ms)
+# sim.runSimWithIntervalFunc(1000.0, intervalFunc)
+
+if saveShards:
+    # Gather/save data option 2: each rank writes its own shard, no gather (open with dataStream.openDataset)
+    dataStream.close()
+    if cfg.doseSchedule:
+        doseEpochs = reduceEpochRates(spikes=dataStream.localSpikes())  # per-rank counts + allreduce (drugTreatment.py)
+        dataStream.updateManifest(doseEpochs=doseEpochs)
+        if sim.rank == 0:
+            for epoch in doseEpochs: print('  drugEffect=%s: %s' % (epoch['drugEffect'], epoch['popRates']))
+    if cfg.outputProfile == 'compact':
+        saveCompact(dataStream.folder)      	# params by content hash in cfg.paramStoreFolder (paramStore.py)
+    else:
+        sim.allSimData = {'dataFolder': dataStream.folder}  # simData is in the shards
+        sim.saveData()                    		# save params
+    if cfg.analysis and sim.rank == 0:
+        print('  Plots need the gathered data: skipped with per-rank shards (plot from dataStream.openDataset)')
+else:
+    # Gather/save data option 1: standard
+    sim.gatherData()
+    if cfg.doseSchedule and sim.rank == 0:
+        sim.allSimData['doseEpochs'] = epochRates()  # pop rates of each drugEffect epoch (saved with simData)
+        for epoch in sim.allSimData['doseEpochs']: print('  drugEffect=%s: %s' % (epoch['drugEffect'], epoch['popRates']))
+
+    sim.saveData()                    			# save params, cell info and sim output to file (pickle,mat,txt,etc)#
+    sim.analysis.plotData()         			# plot spike raster etc
@@ -12,11 +12,25 @@ MPI usage:
 Contributors: salvadordura@gmail.com
 """
 
-import matplotlib; matplotlib.use('Agg')  # to avoid graphics error in servers
+import os; os.environ.setdefault('MPLBACKEND', 'Agg')  # to avoid graphics error in servers (without importing matplotlib)
 from netpyne import sim, specs
 import json
 # FOR OLD BATCH UNCOMMENT THIS NEXT LINE
-from netParams import netParams, cfg
+from cfg import cfg
+from netParamsCache import loadNetParams
+from connGen import connectCells
+from cellStore import createCells
+from loadBalance import balancePops, printImbalance
+from multiSplit import splitPops, splitCells
+from drugTreatment import scheduleDoses, epochRates
+from dataStream import DataStream
+from paramStore import saveCompact
+from popRates import reducePopRates
+from trialProfile import applyMetricsProfile, writeSummary
+from rateMonitor import RateMonitor, runWithRateMonitor
+netParams = loadNetParams(cfg)
+if cfg.metricsOnly: applyMetricsProfile(cfg)  # headless trial: only what the loss needs (trialProfile.py)
+if not cfg.trialGather: cfg.reducePopRates = True  # no gathered data: the loss needs the reduced pop rates (popRates.py)
 import numpy as np
 
 
@@ -68,27 +82,23 @@ sim.initialize(
     simConfig = cfg,
     netParams = netParams)  				# create network object and set cfg and net params
 sim.net.createPops()               			# instantiate network populations
-sim.net.createCells()              			# instantiate network cells based on defined populations
-sim.net.connectCells()            			# create connections between cells based on params
+if cfg.balanceCells: balancer = balancePops()  # cost-aware distribution of cells across ranks (loadBalance.py)
+if cfg.multisplit: splitPops()            	# create PT5B_full cells on several ranks, in pieces (multiSplit.py)
+createCells()                      			# instantiate network cells based on defined populations (cellStore.py)
+if cfg.balanceCells: printImbalance(balancer)  # estimated max/mean load of the ranks
+connectCells()                    			# create connections between cells based on params (connGen.py)
 sim.net.addStims() 							# add network stimulation
+if cfg.multisplit: splitCells()           	# split PT5B_full cells across ranks/threads (multiSplit.py)
 sim.setupRecording()              			# setup variables to record for each cell (spikes, V traces, etc)
-sim.runSim()                      			# run parallel Neuron simulation
-sim.gatherData()                  			# gather spiking data and cell info from each node
-sim.saveData()                    			# save params, cell info and sim output to file (pickle,mat,txt,etc)#
-sim.analysis.plotData()         			# plot spike raster etc
+if cfg.doseSchedule: scheduleDoses()      	# change drugEffect on the live cells at the scheduled times
+if cfg.outputProfile == 'compact':
+    dataStream = DataStream()              	# binary per-rank shards of spikes/traces/cells (dataStream.py)
 
 # -----------------------------------------------------------
 # Algorithm Specs
 # -----------------------------------------------------------
-if sim.rank == 0:
-    # netParams.save("{}/{}_params.json".format(cfg.saveFolder, cfg.simLabel))
-    print('transmitting data...')
-    inputs = cfg.get_mappings()
-    # print(json.dumps({**inputs}))
-    results = sim.analysis.popAvgRates(tranges=cfg.timeRanges, show=False)
-
-    sim.simData['popRates'] = results
-
+def getFitnessFuncArgs():
+    """ Target rates of each pop and max fitness (used by rateFitnessFunc and the rate monitor) """
     fitnessFuncArgs = {}
     pops = {}
     ## Exc pops
@@ -107,12 +117,64 @@ if sim.rank == 0:
         pops[pop] = Itune
     fitnessFuncArgs['pops'] = pops
     fitnessFuncArgs['maxFitness'] = 1000
+    return fitnessFuncArgs
 
-    rateLoss = rateFitnessFunc(sim.simData, **fitnessFuncArgs)
-    results['loss'] = rateLoss
-    out_json = json.dumps({**inputs, **results})
 
-    print(out_json)
-    sim.send(out_json)
+def trialResults(popRates=None, stopTime=None):
+    """
+    Inputs, pop rates and loss of the last run (rank 0); pop rates from the gathered data if not given.
+    If the run was stopped early by the rate monitor (stopTime), the loss is maxFitness.
+    """
+    # netParams.save("{}/{}_params.json".format(cfg.saveFolder, cfg.simLabel))
+    inputs = cfg.get_mappings()
+    # print(json.dumps({**inputs}))
+    results = popRates if popRates is not None else sim.analysis.popAvgRates(tranges=cfg.timeRanges, show=False)
 
+    sim.simData['popRates'] = results
 
+    fitnessFuncArgs = getFitnessFuncArgs()
+    if stopTime is not None:
+        results['loss'] = fitnessFuncArgs['maxFitness']  # saturated loss
+        results['earlyStop'] = stopTime
+        return {**inputs, **results}
+
+    rateLoss = rateFitnessFunc(sim.simData, **fitnessFuncArgs)
+    results['loss'] = rateLoss
+    if cfg.doseSchedule and cfg.trialGather:
+        results['doseEpochs'] = epochRates()  # pop rates of each drugEffect epoch
+    return {**inputs, **results}
+
+
+if cfg.persistentWorker:
+    # build once, then rerun for each weight-only parameter set (see batchWorker.py)
+    from batchWorker import runWorker
+    runWorker(cfg, trialResults)
+else:
+    if cfg.earlyStop:
+        # stop once the running pop rates saturate the loss (rateMonitor.py)
+        fitnessFuncArgs = getFitnessFuncArgs()
+        monitor = RateMonitor(fitnessFuncArgs['pops'], fitnessFuncArgs['maxFitness'], **cfg.earlyStopParams)
+        runWithRateMonitor(monitor)
+        stopTime = monitor.stopTime
+    else:
+        sim.runSim()                      		# run parallel Neuron simulation
+        stopTime = None
+    popRates = reducePopRates(cfg.timeRanges) if cfg.reducePopRates else None  # rates for the loss, no gather (popRates.py)
+    if cfg.trialGather:
+        sim.gatherData()                  		# gather spiking data and cell info from each node
+    if cfg.outputProfile == 'compact':
+        dataStream.close()                  	# spikes/traces of each node (local vectors are kept by gatherData)
+        saveCompact(dataStream.folder)      	# params by content hash in cfg.paramStoreFolder (paramStore.py)
+    elif cfg.trialGather:
+        sim.saveData()                    		# save params, cell info and sim output to file (pickle,mat,txt,etc)#
+    if cfg.trialGather:
+        sim.analysis.plotData()         		# plot spike raster etc
+
+    if sim.rank == 0:
+        print('transmitting data...')
+        results = trialResults(popRates, stopTime)
+        if cfg.metricsOnly: writeSummary(cfg, results)
+        out_json = json.dumps(results)
+
+        print(out_json)
+        sim.send(out_json)
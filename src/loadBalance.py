@@ -0,0 +1,125 @@
+"""
+loadBalance.py
+
+Cost-aware distribution of cells across ranks.
+
+NetPyNE distributes the cells of each pop round-robin, so every rank gets the same number of
+cells although one PT5B_full cell (700+ compartments with na12/na16 HH mechs) costs far more
+than a PV_simple or HH_reduced cell. Here each cell gets an estimated cost, either from its cell
+rule (sum over secs of nseg x (1 + number of mechs)) or from a measured profile
+(cfg.cellCostProfile: json file {pop: cost per cell}), and cells are assigned greedily to the
+least loaded rank, pop by pop in creation order (gids do not change; all ranks compute the same
+assignment).
+
+Usage (init.py / init_batch.py with cfg.balanceCells):
+    sim.net.createPops()
+    balancer = balancePops()    # before the cells are created
+    createCells()
+    printImbalance(balancer)
+"""
+
+import heapq
+import json
+
+# cost of an artificial cell (VecStim, NetStim), relative to one compartment with no mechs
+pointCellCost = 1.0
+
+
+def ruleCost(rule):
+    """ Estimated cost of a cell created from rule: sum over secs of nseg x (1 + number of mechs) """
+    return float(sum(sec.get('geom', {}).get('nseg', 1) * (1 + len(sec.get('mechs', {})))
+                     for sec in rule.get('secs', {}).values()))
+
+
+def _popMatchesConds(popTags, conds):
+    """ True if cells of a pop can match cell rule conds (ynorm ranges overlap, other tags equal) """
+    for key, value in conds.items():
+        if key == 'ynorm':
+            ynormRange = popTags.get('ynormRange', [0.0, 1.0])
+            if not (ynormRange[0] < value[1] and value[0] < ynormRange[1]):
+                return False
+        elif isinstance(value, list):
+            if popTags.get(key) not in value:
+                return False
+        elif popTags.get(key) != value:
+            return False
+    return True
+
+
+def popCosts(pops, cellParams, profile=None):
+    """ Estimated cost per cell of each pop (measured profile values take precedence) """
+    costs = {}
+    for popLabel, pop in pops.items():
+        if profile and popLabel in profile:
+            costs[popLabel] = float(profile[popLabel])
+            continue
+        rules = [rule for rule in cellParams.values() if 'secs' in rule and _popMatchesConds(pop.tags, rule['conds'])]
+        costs[popLabel] = sum(ruleCost(rule) for rule in rules) / len(rules) if rules else pointCellCost
+    return costs
+
+
+class CostBalancer(object):
+    """ Greedy assignment of cells to the least loaded rank, used in place of Pop._distributeCells """
+
+    def __init__(self, nhosts):
+        self.loads = [(0.0, rank) for rank in range(nhosts)]  # heap of (load, rank)
+        self.costs = {}  # cost per cell of each pop (balancePops: set when the cells are created)
+
+    def distribute(self, numCells, cost):
+        """ {rank: [cell indices]} for numCells cells of the same cost """
+        hostCells = {rank: [] for rank in range(len(self.loads))}
+        for i in range(numCells):
+            load, rank = heapq.heappop(self.loads)
+            hostCells[rank].append(i)
+            heapq.heappush(self.loads, (load + cost, rank))
+        return hostCells
+
+    def assign(self, cost, exclude=()):
+        """ Least loaded rank not in exclude, charged with cost """
+        skipped = []
+        load, rank = heapq.heappop(self.loads)
+        while rank in exclude and self.loads:
+            skipped.append((load, rank))
+            load, rank = heapq.heappop(self.loads)
+        heapq.heappush(self.loads, (load + cost, rank))
+        for entry in skipped:
+            heapq.heappush(self.loads, entry)
+        return rank
+
+    def imbalance(self):
+        """ max / mean estimated load """
+        loads = [load for load, _ in self.loads]
+        mean = sum(loads) / len(loads)
+        return max(loads) / mean if mean else 1.0
+
+
+def balancePops():
+    """ Replace the round-robin distribution of all pops by the cost-aware one (call before createCells) """
+    from netpyne import sim
+
+    profile = None
+    if getattr(sim.cfg, 'cellCostProfile', None):
+        with open(sim.cfg.cellCostProfile, 'r') as fileObj:
+            profile = json.load(fileObj)
+
+    balancer = CostBalancer(sim.nhosts)
+    sim.net.cellBalancer = balancer  # also used to place the pieces of split cells (multiSplit.py)
+
+    def popCost(popLabel):
+        if not balancer.costs:  # first pop created: cell rules kept in a cellStore are expanded by now
+            balancer.costs = popCosts(sim.net.pops, sim.net.params.cellParams, profile)
+        return balancer.costs[popLabel]
+
+    for popLabel, pop in sim.net.pops.items():
+        pop._distributeCells = lambda numCells, popLabel=popLabel: balancer.distribute(numCells, popCost(popLabel))
+    return balancer
+
+
+def printImbalance(balancer):
+    """ Cost per cell of each pop and estimated load imbalance of the distribution (call after createCells) """
+    from netpyne import sim
+
+    if sim.rank == 0:
+        print('  Cost-aware cell distribution; cost per cell: %s'
+              % ', '.join('%s=%g' % (popLabel, cost) for popLabel, cost in balancer.costs.items()))
+        print('  Estimated load imbalance (max/mean): %.2f' % balancer.imbalance())
@@ -0,0 +1,121 @@
+"""
+mechSchedule.py
+
+Scheduled changes of mechanism params during the simulation (e.g. PT ih modulation).
+
+Each change is a dict like cfg.modifyMechs:
+    {'startTime', 'endTime', 'cellType', 'mech', 'property', 'newFactor', 'origFactor'}
+cfg.modifyMechs plus the changes in cfg.modifyMechsExtra are resolved once, after the cells exist,
+into one index per (cellType, mech, property) on each rank: pointers to the NEURON segment values
+and their original values (see drugTreatment.indexRefs). Between startTime and endTime the
+segment values are set to newFactor/origFactor x original in one vectorized operation (factors
+of overlapping changes of the same param multiply); at endTime they return to the original.
+
+The changes are event driven: on every initialization the distinct change times within
+cfg.duration are queued with cvode.event (from an FInitializeHandler), so the integration is
+only interrupted at the configured times. Changes starting after cfg.duration are dropped, so
+with the default cfg.modifyMechs nothing is indexed or queued, no FInitializeHandler is
+installed and sim.runSim() runs without callbacks.
+
+Usage (init.py):
+    mechSchedule = MechSchedule(mechChanges(cfg))
+    sim.runSim()
+"""
+
+import numpy as np
+
+from drugTreatment import paramRefs, indexRefs, setCellsFactor
+
+
+def mechChanges(cfg):
+    """ Scheduled mech changes: cfg.modifyMechs plus cfg.modifyMechsExtra """
+    return [cfg.modifyMechs] + list(getattr(cfg, 'modifyMechsExtra', []))
+
+
+def indexCellType(cellType, mech, prop, cells=None):
+    """ Index of mech prop in all secs of the cells with tag cellType (this rank) """
+    from netpyne import sim
+
+    cells = sim.net.cells + getattr(sim.net, 'splitPieces', []) if cells is None else cells
+    selectors = [{'secs': ['all'], 'mechs': [mech], 'variables': [prop]}]
+    refs, seen = [], set()
+    for cell in cells:
+        if cell.tags.get('cellType') == cellType and getattr(cell, 'secs', None):
+            paramRefs(cell.secs, selectors, refs, seen)
+    return indexRefs(refs)
+
+
+class MechSchedule(object):
+    """ Indexed schedule of mech changes; apply(t) sets all changes due at t """
+
+    def __init__(self, changes, cells=None, duration=None):
+        from neuron import h
+        from netpyne import sim
+
+        self.duration = sim.cfg.duration if duration is None else duration
+        self.changes = [change for change in changes if change['startTime'] <= self.duration]  # others never apply
+        self.indices = {}
+        events = []
+        for i, change in enumerate(self.changes):
+            key = (change['cellType'], change['mech'], change['property'])
+            if key not in self.indices:
+                self.indices[key] = indexCellType(*key, cells=cells)
+            events.append((float(change['startTime']), True, i))
+            events.append((float(change['endTime']), False, i))
+        self.events = sorted(events)  # (time, isStart, change): at equal times, ends go before starts
+        self.reset()
+        # queue the events on every (re)initialization, if any change happens within the duration
+        self.handler = h.FInitializeHandler(self.queueEvents) if self.eventTimes() else None
+
+    def reset(self):
+        """ Original values, no change applied yet """
+        self.next = 0
+        self.active = {key: {} for key in self.indices}
+        for index in self.indices.values():
+            setCellsFactor(index, 1.0, reinit=False)
+
+    def eventTimes(self):
+        """ Distinct change times within the simulated duration """
+        return sorted(set(t for t, _, _ in self.events if 0.0 <= t <= self.duration))
+
+    def queueEvents(self):
+        """ Reset and queue one cvode event per change time (called on initialization) """
+        from netpyne import sim
+
+        self.reset()
+        for t in self.eventTimes():
+            sim.cvode.event(t, lambda t=t: self.apply(t))  # h.cvode needs stdrun.hoc
+
+    @staticmethod
+    def changeFactor(change):
+        newFactor, origFactor = change['newFactor'], change['origFactor']
+        return newFactor / origFactor if abs(origFactor) > 0.0 else newFactor
+
+    def nextTime(self):
+        """ Time of the next pending change (None if there are no more) """
+        return self.events[self.next][0] if self.next < len(self.events) else None
+
+    def apply(self, t):
+        """ Apply all pending changes due at t """
+        from netpyne import sim
+
+        if self.next >= len(self.events) or t < self.events[self.next][0]:
+            return
+
+        changed = set()
+        while self.next < len(self.events) and self.events[self.next][0] <= t:
+            _, start, i = self.events[self.next]
+            self.next += 1
+            change = self.changes[i]
+            key = (change['cellType'], change['mech'], change['property'])
+            if start:
+                self.active[key][i] = self.changeFactor(change)
+            else:
+                self.active[key].pop(i, None)
+            changed.add(key)
+
+        for key in sorted(changed):
+            factor = float(np.prod(list(self.active[key].values()))) if self.active[key] else 1.0
+            if sim.rank == 0:
+                print('   t = %0.1f ms: setting %s %s %s to %f x original' % ((t,) + key + (factor,)))
+            setCellsFactor(self.indices[key], factor, updatePy=sim.cfg.saveCellSecs)
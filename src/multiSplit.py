@@ -0,0 +1,275 @@
+"""
+multiSplit.py
+
+Multisplit of the full-morphology PT cells (PT5B_full) with NEURON.
+
+One PT5B_full cell costs more per time step than hundreds of reduced cells, so when there are
+fewer of them than ranks (e.g. cfg.scale < 1) the ranks that hold one gate every time step.
+cfg.multisplit selects how they are split (cfg.multisplitParams):
+
+ 'ranks':   each cell of the pops using cfg.multisplitParams['cellRules'] is created on nPieces ranks
+            (nhosts // number of cells, at most 'maxPieces'). The soma subtrees (apical tree, basal
+            dends) are assigned to the pieces by estimated cost; piece 0 keeps the soma and the spike
+            generation sec (axon) and owns the gid. After the conns and stims are created (they are
+            the same on every piece, since they only depend on the gids), each piece deletes the secs
+            it does not hold, with their synMechs, conns and stims, and the pieces are joined at the
+            soma nodes with pc.multisplit(sec(x), sid). The other pieces are not registered with the
+            gid and are moved from sim.net.cells to sim.net.splitPieces, so recording, gather and the
+            saved cells see one cell per gid (traces of secs moved to other pieces are not recorded).
+ 'threads': each rank runs multisplitParams['nthread'] threads and NEURON splits its cells between
+            them (ParallelComputeTool.multisplit, as multispliton() in cells/PTcell.py).
+
+Usage (init.py / init_batch.py with cfg.multisplit):
+    splitPops()        # before the cells are created (after balancePops(), if used)
+    createCells()
+    connectCells()
+    sim.net.addStims()
+    splitCells()       # before setupRecording()
+"""
+
+import heapq
+
+from loadBalance import ruleCost, _popMatchesConds
+
+
+# ------------------------------------------------------------------------------
+# Partition of a cell rule into pieces
+# ------------------------------------------------------------------------------
+def somaSubtrees(secs):
+    """ (root sec, {child of root: sec names of its subtree}) """
+    children = {}
+    for name, sec in secs.items():
+        children.setdefault(sec.get('topol', {}).get('parentSec'), []).append(name)
+    roots = children.get(None, [])
+    if len(roots) != 1:
+        return None, {}
+
+    subtrees = {}
+    for child in children.get(roots[0], []):
+        names, stack = [], [child]
+        while stack:
+            name = stack.pop()
+            names.append(name)
+            stack.extend(children.get(name, []))
+        subtrees[child] = names
+    return roots[0], subtrees
+
+
+def partitionRule(rule, nPieces):
+    """
+    Split the soma subtrees of a cell rule into at most nPieces pieces of similar cost.
+    Returns {'root', 'secs': [sec names of each piece], 'costs', 'nodes': [soma x of each split node],
+    'roots': [{node index: subtree roots} of each piece]}; piece 0 holds the soma and the spike generation sec.
+    """
+    secs = rule['secs']
+    root, subtrees = somaSubtrees(secs)
+    if root is None:
+        return None
+
+    cost = {child: ruleCost({'secs': {name: secs[name] for name in names}}) for child, names in subtrees.items()}
+    parentX = {child: float(secs[child]['topol'].get('parentX', 1.0)) for child in subtrees}
+    spikeSec = next((name for name, sec in secs.items() if 'spikeGenLoc' in sec), root)
+
+    # subtrees that can move: not holding the spike generation sec, attached at (at most) 2 soma nodes
+    movable = [child for child in subtrees if spikeSec not in subtrees[child]]
+    nodeCost = {}
+    for child in movable:
+        nodeCost[parentX[child]] = nodeCost.get(parentX[child], 0.0) + cost[child]
+    nodes = sorted(nodeCost, key=lambda x: (-nodeCost[x], x))[:2]  # pieces with more than 2 sids are not exact
+    movable = sorted([child for child in movable if parentX[child] in nodes], key=lambda child: (-cost[child], child))
+
+    pieces = [[root] + [child for child in subtrees if child not in movable]]
+    pieces += [[] for _ in range(min(nPieces, len(movable) + 1) - 1)]
+    loads = [(ruleCost({'secs': {root: secs[root]}}) + sum(cost[child] for child in pieces[0][1:]), 0)]
+    loads += [(0.0, i) for i in range(1, len(pieces))]
+    heapq.heapify(loads)
+    for child in movable:
+        load, i = heapq.heappop(loads)
+        pieces[i].append(child)
+        heapq.heappush(loads, (load + cost[child], i))
+    pieces = [pieces[0]] + [piece for piece in pieces[1:] if piece]
+
+    # split nodes: soma nodes with subtrees on pieces other than 0
+    nodes = sorted(set(parentX[child] for piece in pieces[1:] for child in piece))
+    roots = [{j: [child for child in piece if child in parentX and parentX[child] == x]
+              for j, x in enumerate(nodes)} for piece in pieces]
+    roots[0] = {j: [root] for j in range(len(nodes))}
+    secNames = [[root] + [name for child in pieces[0][1:] for name in subtrees[child]]]
+    secNames += [[name for child in piece for name in subtrees[child]] for piece in pieces[1:]]
+    costs = [ruleCost({'secs': {name: secs[name] for name in names}}) for names in secNames]
+    return {'root': root, 'secs': secNames, 'costs': costs, 'nodes': nodes, 'roots': roots}
+
+
+# ------------------------------------------------------------------------------
+# Distribution of the pieces across ranks
+# ------------------------------------------------------------------------------
+class CellSplitter(object):
+    """ Places the pieces of the split cells on ranks, used in place of Pop._distributeCells """
+
+    def __init__(self, nhosts, rank, cellParams, balancer=None, maxPieces=4):
+        self.nhosts = nhosts
+        self.rank = rank
+        self.balancer = balancer  # CostBalancer (loadBalance.py), if cells are distributed by cost
+        self.cellParams = cellParams  # read when the cells are created (stored rules are expanded by then)
+        self.maxPieces = maxPieces
+        self.rules = {}  # pop: label of the cell rule of its cells
+        self.fallbacks = {}  # pop: distribution used if its cells are not split
+        self.parts = {}  # pop: partition of its cell rule
+        self.pieces = {}  # gid: piece held by this rank
+
+    @staticmethod
+    def sid(gid, node):
+        """ multisplit id of a split node (2 per cell at most) """
+        return 2 * gid + node
+
+    def addPop(self, popLabel, ruleLabel, fallback):
+        """ Split the cells of pop (cell rule ruleLabel) if there are enough ranks, else distribute them with fallback """
+        self.rules[popLabel] = ruleLabel
+        self.fallbacks[popLabel] = fallback
+
+    def partition(self, popLabel, numCells):
+        """ Partition of the cell rule of pop in nhosts // numCells pieces (None if the cells are not split) """
+        nPieces = min(self.maxPieces, self.nhosts // numCells) if numCells else 0
+        part = partitionRule(self.cellParams[self.rules[popLabel]], nPieces) if nPieces > 1 else None
+        if not part or len(part['secs']) < 2:
+            return None
+        if self.rank == 0:
+            print('  Multisplit: %d cells of pop %s in %d pieces (%s)'
+                  % (numCells, popLabel, len(part['secs']), ', '.join('%d secs' % len(secNames)
+                                                                       for secNames in part['secs'])))
+        return part
+
+    def distribute(self, popLabel, numCells, firstGid):
+        """ {rank: [cell indices]} with each cell on as many ranks as it has pieces """
+        part = self.partition(popLabel, numCells)  # numCells is only known here for density pops
+        if not part:
+            return self.fallbacks[popLabel](numCells)
+        self.parts[popLabel] = part
+
+        hostCells = {rank: [] for rank in range(self.nhosts)}
+        for i in range(numCells):
+            ranks = []
+            for piece, cost in enumerate(part['costs']):
+                if self.balancer:
+                    rank = self.balancer.assign(cost, exclude=ranks)  # pieces of a cell on different ranks
+                else:
+                    # start from the last rank, which round-robin pops leave with fewer cells
+                    rank = self.nhosts - 1 - (i * len(part['secs']) + piece) % self.nhosts
+                ranks.append(rank)
+                hostCells[rank].append(i)
+                if rank == self.rank:
+                    self.pieces[firstGid + i] = piece
+        return hostCells
+
+    def cellModelClass(self, cellModelClass):
+        """ Cell class that does not register the gid for pieces other than 0 """
+        def createCell(gid, tags):
+            from netpyne import sim
+
+            if self.pieces.get(gid, 0) == 0:
+                return cellModelClass(gid, tags)
+            cell = cellModelClass(gid, tags, associateGid=False)
+            sim.net.gid2lid[gid] = len(sim.net.gid2lid)
+            return cell
+        return createCell
+
+
+def splitPops(balancer=None):
+    """ Create the cells of the split pops on several ranks (call before createCells; by cost if balancePops() was called) """
+    from netpyne import sim
+
+    balancer = balancer or getattr(sim.net, 'cellBalancer', None)
+    splitter = CellSplitter(sim.nhosts, sim.rank, sim.net.params.cellParams, balancer,
+                            sim.cfg.multisplitParams.get('maxPieces', 4))
+    sim.net.cellSplitter = splitter
+    if sim.cfg.multisplit != 'ranks':
+        return splitter
+
+    cellParams = sim.net.params.cellParams
+    for popLabel, pop in sim.net.pops.items():
+        labels = [label for label in sim.cfg.multisplitParams.get('cellRules', ['PT5B_full'])
+                  if label in cellParams and _popMatchesConds(pop.tags, cellParams[label]['conds'])]
+        if not labels:
+            continue
+        # the number of cells (fixed, or from density x volume) is known when the pop distributes them
+        splitter.addPop(popLabel, labels[0], pop._distributeCells)
+        pop._distributeCells = lambda numCells, popLabel=popLabel: splitter.distribute(popLabel, numCells,
+                                                                                       sim.net.lastGid)
+        pop.cellModelClass = splitter.cellModelClass(pop.cellModelClass)
+    return splitter
+
+
+# ------------------------------------------------------------------------------
+# Split the live cells
+# ------------------------------------------------------------------------------
+def dropSecs(cell, keep):
+    """ Delete the secs of a live cell that are not in keep, with their synMechs, conns and stims """
+    from neuron import h
+
+    drop = set(name for name in cell.secs if name not in keep)
+    cell.conns = [conn for conn in cell.conns if conn.get('sec') not in drop]
+    cell.stims = [stim for stim in cell.stims if stim.get('sec') not in drop]
+    for name in drop:
+        sec = cell.secs.pop(name)
+        h.delete_section(sec=sec['hObj'])
+    for secListName, secList in cell.secLists.items():
+        cell.secLists[secListName] = [name for name in secList if name not in drop]
+
+
+def splitCell(cell, part, piece, sid):
+    """ Keep the secs of one piece of a live cell and register its split nodes """
+    from netpyne import sim
+
+    dropSecs(cell, set(part['secs'][piece]))
+    for node, roots in part['roots'][piece].items():
+        if not roots:
+            continue
+        first = cell.secs[roots[0]]
+        if piece == 0:
+            seg = first['hObj'](part['nodes'][node])
+        else:
+            childX = float(first['topol'].get('childX', 0.0))
+            for name in roots[1:]:  # subtrees attached to the same soma node share one split node
+                sec = cell.secs[name]
+                sec['hObj'].connect(first['hObj'](childX), float(sec['topol'].get('childX', 0.0)))
+            seg = first['hObj'](childX)
+        sim.pc.multisplit(seg, sid(cell.gid, node))
+
+
+def splitThreads(nthread):
+    """ nthread threads per rank with NEURON's load-balanced multisplit of the cells between them """
+    from neuron import h
+
+    h.load_file('parcom.hoc')
+    tool = h.ParallelComputeTool()
+    tool.change_nthread(nthread, 1)
+    tool.multisplit(1)
+    return tool
+
+
+def splitCells():
+    """ Split the live cells (call after connectCells and addStims, before setupRecording) """
+    from netpyne import sim
+
+    if sim.cfg.multisplit == 'threads':
+        sim.multisplitTool = splitThreads(sim.cfg.multisplitParams.get('nthread', 2))
+        if sim.rank == 0:
+            print('  Multisplit: cells split between %d threads per rank' % sim.cfg.multisplitParams.get('nthread', 2))
+        return []
+
+    splitter = getattr(sim.net, 'cellSplitter', None)
+    if not splitter or not splitter.parts:
+        return []
+
+    sim.cvode.cache_efficient(1)  # required by multisplit (h.cvode needs stdrun.hoc)
+    for cell in sim.net.cells:
+        if cell.gid in splitter.pieces:
+            splitCell(cell, splitter.parts[cell.tags['pop']], splitter.pieces[cell.gid], splitter.sid)
+    sim.pc.multisplit()  # all split nodes registered
+
+    sim.net.splitPieces = [cell for cell in sim.net.cells if splitter.pieces.get(cell.gid, 0) > 0]
+    sim.net.cells = [cell for cell in sim.net.cells if splitter.pieces.get(cell.gid, 0) == 0]
+    sim.net.gid2lid = {cell.gid: lid for lid, cell in enumerate(sim.net.cells)}
+    sim.net.lid2gid = [cell.gid for cell in sim.net.cells]
+    print('  Multisplit: %d pieces of split cells on node %i' % (len(splitter.pieces), sim.rank))
+    return sim.net.splitPieces
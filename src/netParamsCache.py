@@ -0,0 +1,223 @@
+"""
+netParamsCache.py
+
+Content-addressed cache for the fully built netParams object.
+
+The key is a hash of the cfg fields that affect the network build plus the digests of the
+input files read by netParams.py (cellParams rules, conn/density data, mutant table and the
+PT5B_full single cell model code). On a hit the finished netParams is loaded from a single
+pickle instead of re-executing netParams.py.
+
+With cfg.broadcastNetParams, only rank 0 reads the input files (or the cache) and the other
+ranks receive the built netParams as one compressed blob over sim.pc.
+
+Usage:
+    from cfg import cfg
+    from netParamsCache import loadNetParams
+    netParams = loadNetParams(cfg)
+
+    cfg, netParams = readCmdLineArgs()  # in place of sim.readCmdLineArgs (init.py)
+"""
+
+import glob
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import sys
+import zlib
+
+from fileUtils import atomicWrite
+
+# cfg fields that only control running, recording, saving or plotting (do not change netParams)
+cacheExcludeFields = ['duration', 'dt', 'seeds', 'hParams', 'verbose', 'createNEURONObj', 'createPyStruct',
+                      'connRandomSecFromList', 'cvode_active', 'cvode_atol', 'cache_efficient', 'printRunTime',
+                      'oneSynPerNetcon', 'includeParamsLabel', 'printPopAvgRates', 'checkErrors', 'saveInterval',
+                      'intervalFolder', 'cellsrec', 'recordCells', 'recordTraces', 'recordStim', 'recordTime',
+                      'recordStep', 'simLabel', 'saveFolder', 'savePickle', 'saveJson', 'saveDataInclude',
+                      'backupCfgFile', 'gatherOnlySimData', 'saveCellSecs', 'saveCellConns', 'compactConnFormat',
+                      'analysis', 'timeRanges', 'cacheNetParams', 'netParamsCacheFolder', 'broadcastNetParams',
+                      'connSnapshot', 'connSnapshotFolder', 'persistentWorker', 'workerParamsFile',
+                      'workerResultsFile', 'doseSchedule', 'doseEpochTransient',
+                      'modifyMechsExtra', 'streamData', 'saveShards',
+                      'outputProfile', 'paramStoreFolder', 'reducePopRates', 'trialGather',
+                      'metricsOnly', 'earlyStop', 'earlyStopParams', 'balanceCells',
+                      'cellCostProfile', 'multisplit', 'multisplitParams',
+                      'drugEffect']  # drugEffect: cached rules are rescaled (drugTreatment.py)
+
+# netParams file that is built (netParams= on the command line, see readCmdLineArgs)
+netParamsFile = 'netParams.py'
+
+# input files read while building netParams, besides netParamsFile and cfgInputFiles(cfg) (relative to src/)
+cacheInputFiles = ['cfg.py', 'cellStore.py', 'drugTreatment.py',  # src modules imported by netParams.py
+                   '../cells/*_cellParams.pkl',
+                   '../cells/cellDensity.pkl',
+                   '../cells/MutantParameters_updated_062725.csv',
+                   '../cells/PT5B_full_axon_pt3d.json',
+                   '../cells/Neuron_Model_12HH16HH/*.py',
+                   '../cells/Neuron_Model_12HH16HH/*.hoc',
+                   '../cells/Neuron_Model_12HH16HH/params/*.txt',
+                   '../conn/*.pkl',
+                   '../conn/*.json']
+
+# cfg fields as they were before the last netParams build (netParams.py derives some fields from others)
+cfgBeforeBuild = None
+
+
+# ------------------------------------------------------------------------------
+# Cache key
+# ------------------------------------------------------------------------------
+def _cfgFields(cfg, excludeFields=cacheExcludeFields):
+    """ Return the JSON-serializable cfg fields that affect the netParams build """
+    fields = {}
+    for k, v in sorted(cfg.__dict__.items()):
+        if k.startswith('_') or k in excludeFields:
+            continue
+        try:
+            fields[k] = json.loads(json.dumps(v, sort_keys=True))
+        except (TypeError, ValueError):
+            continue  # skip objects without a stable representation
+    return fields
+
+
+def fileDigest(fileName, blockSize=1 << 20):
+    """ sha1 of file contents """
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as fileObj:
+        for block in iter(lambda: fileObj.read(blockSize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cfgInputFiles(cfg):
+    """ Input files named by cfg values and read by netParams.py (spike files of cfg.ratesLong) """
+    ratesLong = getattr(cfg, 'ratesLong', None) or {}
+    return sorted(set(v for v in ratesLong.values() if isinstance(v, str)))
+
+
+def cacheKey(cfg, inputFiles=cacheInputFiles, excludeFields=cacheExcludeFields):
+    """ Hash of relevant cfg fields + digests of netParamsFile and all input files """
+    sha = hashlib.sha1()
+    sha.update(json.dumps(_cfgFields(cfg, excludeFields), sort_keys=True).encode())
+
+    fileNames = sorted(set(f for pattern in [netParamsFile] + inputFiles for f in glob.glob(pattern)))
+    fileNames += cfgInputFiles(cfg)
+    for fileName in fileNames:
+        sha.update(fileName.encode())
+        sha.update(fileDigest(fileName).encode())
+    return sha.hexdigest()
+
+
+# ------------------------------------------------------------------------------
+# Build / load
+# ------------------------------------------------------------------------------
+def _cfgSnapshot(cfg):
+    return {k: pickle.dumps(v) for k, v in cfg.__dict__.items() if not k.startswith('_')}
+
+
+def buildNetParams(cfg):
+    """ Execute netParamsFile and return (netParams, cfg fields modified during the build) """
+    from netpyne import sim
+
+    before = _cfgSnapshot(cfg)
+    if netParamsFile != 'netParams.py':
+        if netParamsFile.endswith('.py'):
+            netParams = sim.loadPythonModule(netParamsFile).netParams
+        else:
+            netParams = sim.loadNetParams(netParamsFile, setLoaded=False)
+    elif 'netParams' in sys.modules:  # rebuild for a new cfg in the same process (see batchWorker.py)
+        netParams = importlib.reload(sys.modules['netParams']).netParams
+    else:
+        from netParams import netParams
+    after = _cfgSnapshot(cfg)
+    cfgUpdates = {k: getattr(cfg, k) for k, v in after.items() if before.get(k) != v}
+    return netParams, cfgUpdates
+
+
+def _setDrugDose(netParamsDict, cfg):
+    """ Rescale the treated cell rules of a cached build to cfg.drugEffect; False if a rebuild is needed """
+    treatmentParams = netParamsDict.get('treatmentParams')
+    if not treatmentParams:
+        return True
+    from drugTreatment import setRuleDose
+    return setRuleDose(netParamsDict['cellParams'], treatmentParams, cfg.drugEffect)
+
+
+def _loadOrBuild(cfg):
+    """ Return (netParams dict, cfg updates), from the cache folder if an identical build exists """
+    if not getattr(cfg, 'cacheNetParams', False):
+        netParams, cfgUpdates = buildNetParams(cfg)
+        return netParams.todict(), cfgUpdates
+
+    key = cacheKey(cfg)
+    cacheFile = os.path.join(cfg.netParamsCacheFolder, key + '.pkl')
+
+    if os.path.exists(cacheFile):
+        print('Loading cached netParams from %s' % cacheFile)
+        with open(cacheFile, 'rb') as fileObj:
+            data = pickle.load(fileObj)
+        if _setDrugDose(data['netParams'], cfg):
+            return data['netParams'], data['cfgUpdates']
+        print('  Cached netParams cannot be rescaled to drugEffect=%s; rebuilding' % cfg.drugEffect)
+
+    netParams, cfgUpdates = buildNetParams(cfg)
+    data = {'netParams': netParams.todict(), 'cfgUpdates': cfgUpdates}
+
+    os.makedirs(cfg.netParamsCacheFolder, exist_ok=True)
+    with atomicWrite(cacheFile, 'wb') as fileObj:
+        pickle.dump(data, fileObj, protocol=pickle.HIGHEST_PROTOCOL)
+    print('Saved netParams to cache %s' % cacheFile)
+
+    return data['netParams'], data['cfgUpdates']
+
+
+def loadNetParams(cfg):
+    """ Return netParams for cfg (cached and/or built on rank 0 and broadcast, depending on cfg) """
+    from netpyne import sim, specs
+
+    global cfgBeforeBuild
+
+    if hasattr(cfg, 'update'):
+        cfg.update()  # apply batch params before computing the key (netParams.py does the same)
+    # pickled copy: netpyne Dict values of cfgs loaded from json (simConfig=) do not support deepcopy
+    cfgBeforeBuild = pickle.loads(pickle.dumps({k: v for k, v in cfg.__dict__.items() if not k.startswith('_')}))
+
+    if not hasattr(sim, 'nhosts'):  # sim.pc exists once netpyne is imported, sim.nhosts only once set up
+        sim.createParallelContext()  # sets sim.pc, sim.rank and sim.nhosts (called again in sim.initialize)
+    broadcast = getattr(cfg, 'broadcastNetParams', False) and sim.nhosts > 1
+
+    if not broadcast and not getattr(cfg, 'cacheNetParams', False):
+        return buildNetParams(cfg)[0]
+
+    if broadcast:
+        # only rank 0 touches the filesystem; other ranks receive one compressed blob
+        blob = None
+        if sim.rank == 0:
+            blob = zlib.compress(pickle.dumps(_loadOrBuild(cfg), protocol=pickle.HIGHEST_PROTOCOL))
+            print('Broadcasting netParams (%.1f MB) to %d ranks' % (len(blob) / 1e6, sim.nhosts))
+        blob = sim.pc.py_broadcast(blob, 0)
+        netParamsDict, cfgUpdates = pickle.loads(zlib.decompress(blob))
+    else:
+        netParamsDict, cfgUpdates = _loadOrBuild(cfg)
+
+    for k, v in cfgUpdates.items():
+        setattr(cfg, k, v)
+    return specs.NetParams(netParamsDict)
+
+
+def readCmdLineArgs(simConfigDefault='cfg.py', netParamsDefault='netParams.py'):
+    """ sim.readCmdLineArgs (simConfig=, netParams= as passed by netpyne Batch) with netParams from loadNetParams """
+    from netpyne import sim
+
+    global netParamsFile
+
+    netParamsFile = next((arg.split('netParams=')[1] for arg in sys.argv if arg.startswith('netParams=')),
+                         netParamsDefault)
+    argv = sys.argv
+    sys.argv = [arg for arg in argv if not arg.startswith('netParams=')]  # only read cfg here, netParams is built below
+    try:
+        cfg, _ = sim.readCmdLineArgs(simConfigDefault=simConfigDefault, netParamsDefault=None)
+    finally:
+        sys.argv = argv
+    return cfg, loadNetParams(cfg)
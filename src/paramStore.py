@@ -0,0 +1,71 @@
+"""
+paramStore.py
+
+Content-addressed store for run parameters, used by the compact output profile.
+
+netParams and simConfig are pickled (gzip) once into cfg.paramStoreFolder/<sha1 of content>.pkl.gz;
+runs with identical params (e.g. all trials of a batch except for the searched cfg values) share
+the same files. Each run then only writes a small record next to its binary data shards:
+
+    <saveFolder>/<simLabel>_data.json   {'simLabel', 'netParams': key, 'simConfig': key, 'paramStore', 'dataFolder'}
+    <saveFolder>/<simLabel>_data/       spikes, traces and cells (see dataStream.py)
+
+instead of the full parameter tree as both pickle and json (cfg.savePickle + cfg.saveJson).
+
+Usage (init.py / init_batch.py with cfg.outputProfile = 'compact'):
+    saveCompact(dataStream.folder)        # after dataStream.close()
+    netParams = loadParams(record['netParams'], record['paramStore'])
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+
+from fileUtils import atomicWrite
+
+
+def storeParams(params, storeFolder):
+    """ Save params to storeFolder/<hash>.pkl.gz (if not there yet) and return the hash """
+    data = pickle.dumps(params, protocol=pickle.HIGHEST_PROTOCOL)
+    key = hashlib.sha1(data).hexdigest()
+    fileName = os.path.join(storeFolder, key + '.pkl.gz')
+    if not os.path.exists(fileName):
+        os.makedirs(storeFolder, exist_ok=True)
+        with atomicWrite(fileName, 'wb', opener=gzip.open, compresslevel=6) as fileObj:
+            fileObj.write(data)
+    return key
+
+
+def loadParams(key, storeFolder):
+    """ Params saved with storeParams """
+    with gzip.open(os.path.join(storeFolder, key + '.pkl.gz'), 'rb') as fileObj:
+        return pickle.load(fileObj)
+
+
+def saveCompact(dataFolder, cfg=None):
+    """ Store netParams/simConfig by hash and write the run record (rank 0); returns the record """
+    from netpyne import sim
+
+    cfg = cfg or sim.cfg
+    if sim.rank != 0:
+        return None
+
+    sim.timing('start', 'saveTime')
+    netParams = {k: v for k, v in sim.net.params.__dict__.items() if not k.startswith('_')}  # no func objects
+    simConfig = {k: v for k, v in cfg.__dict__.items() if not k.startswith('_')}
+    record = {'simLabel': cfg.simLabel,
+              'netParams': storeParams(netParams, cfg.paramStoreFolder),
+              'simConfig': storeParams(simConfig, cfg.paramStoreFolder),
+              'paramStore': os.path.abspath(cfg.paramStoreFolder),
+              'dataFolder': os.path.abspath(dataFolder)}
+
+    os.makedirs(cfg.saveFolder, exist_ok=True)
+    fileName = os.path.join(cfg.saveFolder, cfg.simLabel + '_data.json')
+    with open(fileName, 'w') as fileObj:
+        json.dump(record, fileObj, indent=1)
+    sim.timing('stop', 'saveTime')
+    print('  Saved run record %s (params %s, %s; %.2f s)'
+          % (fileName, record['netParams'][:8], record['simConfig'][:8], sim.timingData['saveTime']))
+    return record
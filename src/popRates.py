@@ -0,0 +1,87 @@
+"""
+popRates.py
+
+Population rates without gathering the spikes.
+
+Each rank counts the spikes of its own cells per (pop, time range) and the number of its cells per
+pop; one allreduce (sum) of these counts gives every rank the same rates that
+sim.analysis.popAvgRates() computes from the gathered data (same time range conventions and
+output format), so the batch loss does not need sim.gatherData().
+
+Usage (init_batch.py with cfg.reducePopRates = True):
+    popRates = reducePopRates(cfg.timeRanges)   # all ranks
+"""
+
+import numpy as np
+
+
+def _tranges(tranges, duration):
+    """ List of [start, stop] ranges, as in sim.analysis.popAvgRates """
+    if not isinstance(tranges, list):  # True or None
+        return [[0, duration]]
+    return tranges if isinstance(tranges[0], (list, tuple)) else [tranges]
+
+
+def localSpikePops(pops, spikes=None):
+    """ (spike times, pop index of each spike, cell counts per pop) of the cells on this rank """
+    from netpyne import sim
+
+    popIndex = {pop: i for i, pop in enumerate(pops)}
+    gids = np.array([cell.gid for cell in sim.net.cells], dtype=int)
+    cellPops = np.array([popIndex[cell.tags['pop']] for cell in sim.net.cells], dtype=int)
+    numCells = np.bincount(cellPops, minlength=len(pops))
+
+    if spikes is None:
+        spikes = (sim.simData['spkt'].as_numpy(), sim.simData['spkid'].as_numpy())
+    spkt, spkid = np.asarray(spikes[0], dtype=float), np.asarray(spikes[1]).astype(int)
+    if not len(spkt) or not len(gids):
+        return spkt[:0], np.zeros(0, dtype=int), numCells
+    order = np.argsort(gids)
+    return spkt, cellPops[order][np.searchsorted(gids[order], spkid)], numCells
+
+
+def localSpikeCounts(pops, tranges, spikes=None):
+    """ (spike counts per (pop, trange), cell counts per pop) of the cells on this rank """
+    spkt, spikePops, numCells = localSpikePops(pops, spikes)
+    counts = np.zeros((len(pops), len(tranges)))
+    for i, (start, stop) in enumerate(tranges):
+        inRange = (spkt >= start) & (spkt <= stop)
+        counts[:, i] = np.bincount(spikePops[inRange], minlength=len(pops))
+    return counts, numCells
+
+
+def allreduceSum(*arrays):
+    """ Sum of each array over ranks (one allreduce for all) """
+    from neuron import h
+    from netpyne import sim
+
+    vec = h.Vector(np.concatenate([np.ravel(a) for a in arrays]).astype(float))
+    sim.pc.allreduce(vec, 1)
+    total, sums = np.array(vec), []  # a copy: vec is freed on return
+    for a in arrays:
+        sums.append(total[:np.size(a)].reshape(np.shape(a)))
+        total = total[np.size(a):]
+    return sums
+
+
+def reducePopRates(tranges=None, show=False):
+    """ Pop rates (Hz) as returned by sim.analysis.popAvgRates(tranges), using one allreduce instead of a gather """
+    from netpyne import sim
+    from netpyne.specs import Dict
+
+    pops = list(sim.net.pops)
+    tranges = _tranges(tranges, sim.cfg.duration)
+    counts, numCells = allreduceSum(*localSpikeCounts(pops, tranges))  # sum over ranks
+
+    avgRates = Dict()
+    for i, pop in enumerate(pops):
+        if numCells[i] <= 0:
+            continue
+        rates = [counts[i, j] / numCells[i] / ((stop - start) / 1000.0) for j, (start, stop) in enumerate(tranges)]
+        if len(tranges) == 1:
+            avgRates[pop] = rates[0]
+        else:
+            avgRates[pop] = {'%d_%d' % (start, stop): rate for (start, stop), rate in zip(tranges, rates)}
+        if show and sim.rank == 0:
+            print('   %s : %s Hz' % (pop, avgRates[pop]))
+    return avgRates
@@ -0,0 +1,118 @@
+"""
+rateMonitor.py
+
+Online pop rate monitor to stop batch trials whose loss is already saturated.
+
+The running rate of every tuned pop over [window start, t] is checked at checkpoints t =
+window start + minTime, then every interval ms until the window stop (cfg.duration if None).
+The rates are reduced over ranks (popRates.py) and scored like rateFitnessFunc: a pop is
+saturated if its rate is below its 'min' or exp(|target - rate| / width) >= maxFitness. When at
+least `fraction` of the tuned pops are saturated (default: all, i.e. a silent or runaway network)
+the trial is considered decided and the run stops with loss = maxFitness.
+
+cfg.earlyStopParams sets these; the default window [100, None] skips the initialization
+transient and checks first at 250 ms, so silent or runaway trials stop early in the run:
+    cfg.earlyStopParams = {'window': [100.0, None], 'minTime': 150.0, 'interval': 250.0, 'fraction': 1.0}
+
+The checkpoints are NEURON events queued on every initialization and a decided checkpoint sets
+h.stoprun, so the run itself is the regular sim.runSim() (preRun, cfg.use_local_dt, ...). With
+cfg.coreneuron there are no Python events and the trial runs to the end.
+
+Usage (init_batch.py with cfg.earlyStop = True):
+    monitor = RateMonitor(fitnessFuncArgs['pops'], fitnessFuncArgs['maxFitness'], **cfg.earlyStopParams)
+    runWithRateMonitor(monitor)      # instead of sim.runSim()
+    if monitor.stopTime is not None: loss = maxFitness
+"""
+
+import numpy as np
+
+from popRates import reducePopRates
+
+
+class RateMonitor(object):
+    """ Decides at each checkpoint whether the trial loss is already saturated """
+
+    def __init__(self, pops, maxFitness, interval=250.0, minTime=150.0, fraction=1.0, window=(100.0, None)):
+        self.pops = pops  # {pop: {'target', 'width', 'min'}} as passed to rateFitnessFunc
+        self.maxFitness = maxFitness
+        self.interval = interval
+        self.minTime = minTime
+        self.fraction = fraction
+        self.window = window  # [start, stop] (ms) of the running rates; stop None = cfg.duration
+        self.stopTime = None
+        self.saturated = []
+        self.handler = None
+
+    def checkpoints(self):
+        """ Times at which the running rates are checked """
+        from netpyne import sim
+
+        stop = sim.cfg.duration if self.window[1] is None else min(self.window[1], sim.cfg.duration)
+        return [float(t) for t in np.arange(self.window[0] + self.minTime, stop, self.interval)]
+
+    def isSaturated(self, tune, rate):
+        return rate <= tune['min'] or abs(tune['target'] - rate) / tune['width'] >= np.log(self.maxFitness)  # exp(...) >= maxFitness
+
+    def check(self, t):
+        """ True (on all ranks) if the loss is decided at t; collective call """
+        from netpyne import sim
+
+        rates = reducePopRates([[self.window[0], t]])
+        pops = [pop for pop in self.pops if pop in rates]
+        self.saturated = [pop for pop in pops if self.isSaturated(self.pops[pop], rates[pop])]
+        if pops and len(self.saturated) >= self.fraction * len(pops):
+            self.stopTime = t
+            if sim.rank == 0:
+                print('  Stopping at t = %0.1f ms: rates of %d/%d pops saturate the loss (%s)'
+                      % (t, len(self.saturated), len(pops), ', '.join(self.saturated)))
+            return True
+        return False
+
+    def install(self):
+        """ Check the checkpoints during every following run (until uninstall) """
+        from neuron import h
+
+        self.handler = h.FInitializeHandler(self.queueEvents)
+
+    def uninstall(self):
+        self.handler = None
+
+    def queueEvents(self):
+        """ Queue one cvode event per checkpoint (called on initialization) """
+        from neuron import h
+        from netpyne import sim
+
+        h.stoprun = 0
+        self.stopTime = None
+        self.saturated = []
+        for t in self.checkpoints():
+            sim.cvode.event(t, lambda t=t: self.checkpoint(t))
+
+    def checkpoint(self, t):
+        """ Stop the run (all ranks) if the loss is decided at t """
+        from neuron import h
+
+        if self.check(t):
+            h.stoprun = 1  # pc.psolve returns at t
+
+
+def runWithRateMonitor(monitor):
+    """ sim.runSim() with the rate monitor checked at its checkpoints; returns True if stopped early """
+    from neuron import h
+    from netpyne import sim
+
+    if sim.cfg.coreneuron:
+        if sim.rank == 0:
+            print('  Rate monitor not available with CoreNEURON (no Python events); running to the end')
+        sim.runSim()
+        return False
+
+    monitor.install()
+    try:
+        sim.runSim()
+    finally:
+        monitor.uninstall()
+        h.stoprun = 0
+    if monitor.stopTime is not None and sim.rank == 0:
+        print('  Simulated %0.1f of %s ms (stopped by the rate monitor)' % (h.t, sim.cfg.duration))
+    return monitor.stopTime is not None
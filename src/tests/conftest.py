@@ -0,0 +1,10 @@
+import os
+import sys
+
+srcFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if srcFolder not in sys.path:
+    sys.path.insert(0, srcFolder)  # modules of src/ are imported by name, as in init.py
+
+testsFolder = os.path.dirname(os.path.abspath(__file__))
+if testsFolder not in sys.path:
+    sys.path.insert(0, testsFolder)  # netHelpers, also under --import-mode=importlib
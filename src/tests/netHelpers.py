@@ -0,0 +1,30 @@
+""" Helpers shared by the tests (imported by name: conftest.py puts tests/ on sys.path) """
+
+
+def createNet(weight=0.01, numCells=10, **cfgFields):
+    """ Small network of single-compartment hh cells (E->E rule + NetStim), created but not connected """
+    from netpyne import sim, specs
+
+    netParams = specs.NetParams()
+    netParams.cellParams['E'] = {'conds': {'cellType': 'E'},
+                                 'secs': {'soma': {'geom': {'diam': 18.8, 'L': 18.8},
+                                                   'mechs': {'hh': {'gnabar': 0.12, 'gkbar': 0.036, 'gl': 0.0003,
+                                                                    'el': -54.3}}}}}
+    netParams.popParams['E'] = {'cellType': 'E', 'numCells': numCells}
+    netParams.synMechParams['AMPA'] = {'mod': 'Exp2Syn', 'tau1': 0.1, 'tau2': 1.0, 'e': 0}
+    netParams.connParams['E->E'] = {'preConds': {'pop': 'E'}, 'postConds': {'pop': 'E'}, 'probability': 0.5,
+                                    'weight': weight, 'delay': 5, 'synMech': 'AMPA'}
+    netParams.stimSourceParams['bkg'] = {'type': 'NetStim', 'rate': 20, 'noise': 0.5}
+    netParams.stimTargetParams['bkg->E'] = {'source': 'bkg', 'conds': {'pop': 'E'}, 'weight': 0.01, 'delay': 1,
+                                            'synMech': 'AMPA'}
+
+    cfg = specs.SimConfig()
+    cfg.duration = 100
+    cfg.verbose = False
+    cfg.includeParamsLabel = False  # as in cfg.py
+    for k, v in cfgFields.items():
+        setattr(cfg, k, v)
+    sim.initialize(simConfig=cfg, netParams=netParams)
+    sim.net.createPops()
+    sim.net.createCells()
+    return sim
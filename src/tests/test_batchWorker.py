@@ -0,0 +1,40 @@
+import pytest
+
+from netHelpers import createNet
+
+
+def test_updateWeights():
+    from netpyne import specs
+
+    from batchWorker import updateWeights
+    from connGen import connectCells
+
+    sim = createNet(weight=0.01, persistentWorker=True)
+    connectCells()
+    conns = [conn for cell in sim.net.cells for conn in cell.conns]
+    ruleConns = [conn for conn in conns if isinstance(conn['preGid'], int)]
+    stimConns = [conn for conn in conns if not isinstance(conn['preGid'], int)]
+    assert ruleConns and all(conn['label'] == 'E->E' for conn in ruleConns)
+    stimWeights = [conn['weight'] for conn in stimConns]
+
+    newNetParams = specs.NetParams(sim.net.params.todict())
+    newNetParams.connParams['E->E']['weight'] = 0.025
+    updateWeights(newNetParams)
+
+    assert all(conn['weight'] == pytest.approx(0.025) for conn in ruleConns)
+    assert all(conn['hObj'].weight[0] == pytest.approx(0.025) for conn in ruleConns)
+    assert [conn['weight'] for conn in stimConns] == stimWeights  # stims unchanged
+    assert sim.net.params is newNetParams
+
+
+def test_updateWeightsWithoutLabels():
+    from netpyne import specs
+
+    from batchWorker import updateWeights
+
+    sim = createNet(weight=0.01)
+    sim.net.connectCells()  # includeParamsLabel = False: conns have no label
+    newNetParams = specs.NetParams(sim.net.params.todict())
+    newNetParams.connParams['E->E']['weight'] = 0.025
+    with pytest.raises(ValueError):
+        updateWeights(newNetParams)
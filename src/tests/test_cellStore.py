@@ -0,0 +1,29 @@
+import os
+
+from cellStore import loadCellRule, storeCellRule
+
+rule = {'conds': {'cellType': 'PT', 'cellModel': 'HH_full'},
+        'secLists': {'apical': ['apic_0']},
+        'secs': {'soma': {'geom': {'L': 20.0, 'nseg': 1, 'pt3d': [[0.0, 0.0, 0.0, 20.0], [0.0, 20.0, 0.0, 20.0]]},
+                          'mechs': {'pas': {'g': 1e-4, 'e': -70.0}, 'na12': {'gbar': [0.1], 'fn': 'x'}},
+                          'topol': {}},
+                 'apic_0': {'geom': {'L': 100.0, 'nseg': 3},
+                            'mechs': {'pas': {'g': [1e-4, 2e-4, 3e-4], 'e': -70.0}},
+                            'weightNorm': [0.5, 0.6, 0.7],
+                            'topol': {'parentSec': 'soma', 'parentX': 1.0, 'childX': 0.0}}}}
+
+
+def test_storeRoundTrip(tmp_path):
+    placeholder = storeCellRule(rule, str(tmp_path))
+    assert set(placeholder) == {'conds', 'store'}
+    assert os.listdir(tmp_path) == [os.path.basename(placeholder['store'])]  # no temp folders left
+
+    loaded = loadCellRule(placeholder['store'])
+    assert loaded['conds'] == rule['conds'] and loaded['secLists'] == rule['secLists']
+    assert [list(p) for p in loaded['secs']['soma']['geom']['pt3d']] == rule['secs']['soma']['geom']['pt3d']
+    assert loaded['secs']['soma']['mechs'] == rule['secs']['soma']['mechs']
+    assert loaded['secs']['apic_0']['mechs'] == rule['secs']['apic_0']['mechs']
+    assert loaded['secs']['apic_0']['weightNorm'] == rule['secs']['apic_0']['weightNorm']
+    assert loaded['secs']['apic_0']['topol'] == rule['secs']['apic_0']['topol']
+
+    assert storeCellRule(rule, str(tmp_path)) == placeholder  # same rule: same store
@@ -0,0 +1,55 @@
+from collections import Counter
+
+import numpy as np
+from netpyne.network.conn import _findPrePostCellsCondition
+
+from connGen import sampleBinConns
+
+preBins = [[0.1, 0.2], [0.2, 0.3], [0.3, 0.37], [0.3125, 0.75], [0.4375, 0.8125]]  # last ones overlap (conn.pkl 'K')
+postBins = [[0.37, 0.4375], [0.4375, 0.5], [0.5, 0.5625], [0.8, 0.9], [0.9, 1.0]]
+
+
+def _cellTags(rng):
+    """ cells on every bin edge plus random ones; gids 0.. (pre and post pop share cells, as for IT->IT) """
+    edges = sorted(set(x for bins in [preBins, postBins] for edge in bins for x in edge))
+    ynorms = edges + list(rng.uniform(0.0, 1.0, 40))
+    return {gid: {'pop': 'IT', 'ynorm': float(ynorm)} for gid, ynorm in enumerate(ynorms)}
+
+
+def _condsConns(allCellTags, weight):
+    """ (pre gid, post gid, weight) of the per-bin connParams rules with probability 1, as netpyne matches their conds """
+    conns = Counter()
+    for ipre, preBin in enumerate(preBins):
+        for ipost, postBin in enumerate(postBins):
+            pre, post = _findPrePostCellsCondition(None, allCellTags, {'ynorm': preBin}, {'ynorm': postBin})
+            for postGid in post or {}:
+                for preGid in pre:
+                    if preGid != postGid:
+                        conns[(preGid, postGid, weight[ipost, ipre])] += 1
+    return conns
+
+
+def test_sampleBinConnsMatchesConds():
+    rng = np.random.default_rng(0)
+    allCellTags = _cellTags(rng)
+    gids = np.array(sorted(allCellTags))
+    pos = {'ynorm': np.array([allCellTags[gid]['ynorm'] for gid in gids])}
+    weight = np.arange(len(postBins) * len(preBins), dtype=float).reshape(len(postBins), len(preBins)) + 1.0
+    rule = {'preBins': preBins, 'postBins': postBins, 'probability': np.ones_like(weight), 'weight': weight}
+
+    ipre, ipost, w = sampleBinConns(rule, gids, pos, gids, pos, rng)
+    conns = Counter(zip(gids[ipre].tolist(), gids[ipost].tolist(), w.tolist()))
+    assert conns == _condsConns(allCellTags, weight)
+
+
+def test_sampleBinConnsProbability():
+    rng = np.random.default_rng(1)
+    gids = np.arange(400)
+    pos = {'ynorm': rng.uniform(0.1, 0.3, len(gids))}
+    rule = {'preBins': [[0.1, 0.2], [0.2, 0.3]], 'postBins': [[0.1, 0.3]],
+            'probability': [[0.0, 0.25]], 'weight': [[1.0, 2.0]]}
+
+    ipre, ipost, w = sampleBinConns(rule, gids, pos, gids, pos, rng)
+    assert np.all(pos['ynorm'][ipre] >= 0.2) and np.all(w == 2.0)
+    numPairs = np.count_nonzero(pos['ynorm'] >= 0.2) * (len(gids) - 1)
+    assert abs(len(ipre) / numPairs - 0.25) < 0.01
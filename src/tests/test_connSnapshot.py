@@ -0,0 +1,41 @@
+from netHelpers import createNet
+
+
+def _conns(sim):
+    return sorted((cell.gid, conn['preGid'], conn['weight'], conn['label'])
+                  for cell in sim.net.cells for conn in cell.conns if isinstance(conn['preGid'], int))
+
+
+def test_snapshotRoundTrip(tmp_path, monkeypatch):
+    import connSnapshot
+    from connGen import connectCells
+
+    monkeypatch.chdir(tmp_path)  # no input files: the snapshot key only depends on cfg
+    folder = str(tmp_path / 'connSnapshot')
+
+    sim = createNet(weight=0.01, connSnapshot=True, connSnapshotFolder=folder)
+    connectCells()
+    saved = _conns(sim)
+    assert saved and all(label == 'E->E' for _, _, _, label in saved)
+    assert (tmp_path / 'connSnapshot').exists()
+
+    sim = createNet(weight=0.03, connSnapshot=True, connSnapshotFolder=folder)  # weight-only change
+    assert connSnapshot.connectFromSnapshot()
+    loaded = _conns(sim)
+    assert [conn[:2] for conn in loaded] == [conn[:2] for conn in saved]
+    assert all(abs(new[2] - 3 * old[2]) < 1e-12 for new, old in zip(loaded, saved))
+    assert all('hObj' in conn for cell in sim.net.cells for conn in cell.conns)
+
+
+def test_snapshotChangedRules(tmp_path, monkeypatch):
+    import connSnapshot
+    from connGen import connectCells
+
+    monkeypatch.chdir(tmp_path)
+    folder = str(tmp_path / 'connSnapshot')
+    createNet(connSnapshot=True, connSnapshotFolder=folder)
+    connectCells()
+
+    sim = createNet(connSnapshot=True, connSnapshotFolder=folder)
+    sim.net.params.connParams['E->E']['weight'] = 'uniform(0.01, 0.02)'  # not a numeric weight: cannot rescale
+    assert not connSnapshot.connectFromSnapshot()
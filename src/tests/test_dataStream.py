@@ -0,0 +1,36 @@
+import numpy as np
+
+from netHelpers import createNet
+
+
+def _run(tmp_path, streamData):
+    from dataStream import DataStream, openDataset
+
+    sim = createNet(duration=200.0, saveFolder=str(tmp_path), simLabel='stream%d' % streamData,
+                    streamData=streamData, saveInterval=50.0, recordStep=0.1,
+                    recordCells=['all'], recordTraces={'V_soma': {'sec': 'soma', 'loc': 0.5, 'var': 'v'}})
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    dataStream = DataStream()
+    sim.runSim()
+    dataStream.close()
+    return openDataset(dataStream.folder)
+
+
+def test_streamedShardsMatchSingleChunk(tmp_path):
+    single = _run(tmp_path, streamData=False)
+    streamed = _run(tmp_path, streamData=True)
+
+    assert len(single.shard('node0')['chunks']) == 1
+    assert [chunk['t'] for chunk in streamed.shard('node0')['chunks']] == [50.0, 100.0, 150.0, 200.0]
+
+    spkt, spkid = single.spikes()
+    assert len(spkt)
+    assert np.array_equal(streamed.spikes()[0], spkt) and np.array_equal(streamed.spikes()[1], spkid)
+    assert np.array_equal(streamed.spikes(trange=[50, 100])[0], spkt[(spkt >= 50) & (spkt < 100)])
+
+    v = single.trace('V_soma', 3)
+    assert len(v) == 2000
+    assert np.array_equal(streamed.trace('V_soma', 3), v)
+    assert streamed.popRates([0, 200]) == single.popRates([0, 200])
@@ -0,0 +1,87 @@
+from drugTreatment import scaleRules, setRuleDose
+
+selectors = [{'cellTypes': ['PT5B_full'], 'secs': ['all'], 'mechs': ['na12'], 'variables': ['gbar']}]
+
+
+def _cellParams():
+    return {'PT5B_full': {'secs': {'soma': {'mechs': {'na12': {'gbar': [1.0, 2.0], 'vshift': 1.0}}},
+                                   'axon': {'mechs': {'na12': {'gbar': 4.0}, 'pas': {'gbar': 1.0}}}}},
+            'IT5A_full': {'secs': {'soma': {'mechs': {'na12': {'gbar': 1.0}}}}}}
+
+
+def test_scaleRules():
+    cellParams = _cellParams()
+    assert scaleRules(cellParams, selectors, 0.5) == 3
+    secs = cellParams['PT5B_full']['secs']
+    assert secs['soma']['mechs']['na12'] == {'gbar': [0.5, 1.0], 'vshift': 1.0}  # lists stay lists
+    assert secs['axon']['mechs'] == {'na12': {'gbar': 2.0}, 'pas': {'gbar': 1.0}}
+    assert cellParams['IT5A_full']['secs']['soma']['mechs']['na12']['gbar'] == 1.0
+
+
+def test_setRuleDose():
+    cellParams = _cellParams()
+    scaleRules(cellParams, selectors, 0.5)
+    treatmentParams = {'selectors': selectors, 'dose': 0.5}
+    assert setRuleDose(cellParams, treatmentParams, 0.25)
+    assert cellParams['PT5B_full']['secs']['soma']['mechs']['na12']['gbar'] == [0.25, 0.5]
+    assert treatmentParams['dose'] == 0.25
+
+    assert not setRuleDose(cellParams, {'selectors': selectors, 'dose': 0.0}, 0.5)  # built with dose 0
+    stored = {'PT5B_full': {'conds': {}, 'store': 'folder'}}
+    assert not setRuleDose(stored, {'selectors': selectors, 'dose': 0.5}, 0.25)  # rule kept in a cellStore
+
+
+def test_setCellsFactorCvode():
+    from netHelpers import createNet
+    from drugTreatment import indexCells, setCellsFactor
+
+    sim = createNet(cvode_active=True)
+    sim.net.connectCells()
+    sim.setupRecording()
+    index = indexCells([{'cellTypes': ['E'], 'secs': ['all'], 'mechs': ['hh'], 'variables': ['gnabar']}])
+    setCellsFactor(index, 0.5)  # re_init of the variable step integrator
+    assert [seg.hh.gnabar for cell in sim.net.cells for seg in cell.secs['soma']['hObj']] == [0.06] * 10
+    assert sim.net.cells[0].secs['soma']['mechs']['hh']['gnabar'] == 0.06
+
+
+def test_scheduleDoses():
+    from netHelpers import createNet
+    from drugTreatment import doseEpochs, scheduleDoses
+
+    sim = createNet(duration=50.0, treatment=False, drugEffect=1.0, doseSchedule=[[20.0, 0.5], [40.0, 0.25]],
+                    treatmentSelectors=[{'cellTypes': ['E'], 'secs': ['all'], 'mechs': ['hh'],
+                                         'variables': ['gnabar']}])
+    assert doseEpochs(sim.cfg) == [(0.0, 20.0, 1.0), (20.0, 40.0, 0.5), (40.0, 50.0, 0.25)]
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    scheduleDoses()
+    sim.runSim()
+    assert [seg.hh.gnabar for cell in sim.net.cells for seg in cell.secs['soma']['hObj']] == [0.03] * 10
+
+
+def test_reduceEpochRatesMatchesEpochRates(tmp_path):
+    from netHelpers import createNet
+    from dataStream import DataStream
+    from drugTreatment import epochRates, reduceEpochRates, scheduleDoses
+
+    sim = createNet(duration=200.0, treatment=False, drugEffect=1.0, doseSchedule=[[100.0, 0.5]],
+                    doseEpochTransient=20.0, streamData=True, saveInterval=50.0, saveFolder=str(tmp_path),
+                    simLabel='doses', treatmentSelectors=[{'cellTypes': ['E'], 'secs': ['all'], 'mechs': ['hh'],
+                                                           'variables': ['gnabar']}])
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    scheduleDoses()
+    dataStream = DataStream()
+    sim.runSim()
+    dataStream.close()  # spikes are in the shard, not in simData
+    spikes = dataStream.localSpikes()
+    epochs = reduceEpochRates(spikes=spikes)
+
+    sim.allSimData = {'spkt': spikes[0].tolist(), 'spkid': spikes[1].tolist()}  # as after gatherData
+    sim.net.allPops = {pop: {'cellGids': p.cellGids} for pop, p in sim.net.pops.items()}
+    expected = epochRates()
+    assert [(e['start'], e['stop'], e['drugEffect']) for e in epochs] == [(20.0, 100.0, 1.0), (120.0, 200.0, 0.5)]
+    assert epochs[0]['popRates']['E'] > 0
+    assert epochs == expected
@@ -0,0 +1,45 @@
+import gzip
+import os
+
+import pytest
+
+from fileUtils import atomicFolder, atomicWrite
+
+
+def test_atomicWrite(tmp_path):
+    fileName = str(tmp_path / 'data.txt')
+    with atomicWrite(fileName) as fileObj:
+        fileObj.write('partial')
+        assert not os.path.exists(fileName)
+    with open(fileName) as fileObj:
+        assert fileObj.read() == 'partial'
+    assert os.listdir(tmp_path) == ['data.txt']
+
+
+def test_atomicWriteGzip(tmp_path):
+    fileName = str(tmp_path / 'data.gz')
+    with atomicWrite(fileName, 'wb', opener=gzip.open, compresslevel=1) as fileObj:
+        fileObj.write(b'abc')
+    with gzip.open(fileName, 'rb') as fileObj:
+        assert fileObj.read() == b'abc'
+
+
+def test_atomicWriteError(tmp_path):
+    fileName = str(tmp_path / 'data.txt')
+    with pytest.raises(ValueError):
+        with atomicWrite(fileName) as fileObj:
+            fileObj.write('partial')
+            raise ValueError
+    assert os.listdir(tmp_path) == []
+
+
+def test_atomicFolder(tmp_path):
+    folder = str(tmp_path / 'store')
+    with atomicFolder(folder) as tmpFolder:
+        open(os.path.join(tmpFolder, 'a'), 'w').close()
+    assert os.listdir(folder) == ['a']
+
+    with atomicFolder(folder) as tmpFolder:  # written by another process meanwhile: keep the first one
+        open(os.path.join(tmpFolder, 'b'), 'w').close()
+    assert os.listdir(folder) == ['a']
+    assert os.listdir(tmp_path) == ['store']
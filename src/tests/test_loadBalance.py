@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from loadBalance import CostBalancer, popCosts, ruleCost
+
+
+def test_distributeFillsTheLeastLoadedRank():
+    balancer = CostBalancer(3)
+    assert balancer.distribute(2, 10.0) == {0: [0], 1: [1], 2: []}
+    assert balancer.distribute(4, 1.0) == {0: [], 1: [], 2: [0, 1, 2, 3]}
+    assert balancer.imbalance() == pytest.approx(10.0 / 8.0)
+
+
+def test_assignSkipsExcludedRanks():
+    balancer = CostBalancer(3)
+    assert balancer.assign(5.0) == 0
+    assert balancer.assign(5.0, exclude=[1]) == 2
+    assert balancer.assign(1.0, exclude=[1, 2]) == 0  # least loaded not excluded
+    assert balancer.assign(1.0) == 1
+    assert sorted(balancer.loads) == [(1.0, 1), (5.0, 2), (6.0, 0)]
+
+
+def test_imbalanceOfEmptyBalancer():
+    assert CostBalancer(4).imbalance() == 1.0
+
+
+def test_popCosts():
+    soma = {'geom': {'nseg': 1}, 'mechs': {'hh': {}, 'pas': {}}}
+    dend = {'geom': {'nseg': 5}, 'mechs': {'pas': {}}}
+    cellParams = {'PT_full': {'conds': {'cellType': 'PT', 'cellModel': 'HH_full'},
+                              'secs': {'soma': soma, 'dend': dend}},
+                  'IT_upper': {'conds': {'cellType': 'IT', 'ynorm': [0.1, 0.3]}, 'secs': {'soma': soma}},
+                  'IT_lower': {'conds': {'cellType': 'IT', 'ynorm': [0.3, 0.6]}, 'secs': {'soma': soma, 'dend': dend}},
+                  'stored': {'conds': {'cellType': 'PV'}, 'store': 'folder'}}
+    pops = {'PT5B': SimpleNamespace(tags={'cellType': 'PT', 'cellModel': 'HH_full', 'ynormRange': [0.5, 0.6]}),
+            'IT2': SimpleNamespace(tags={'cellType': 'IT', 'ynormRange': [0.12, 0.3]}),
+            'IT5': SimpleNamespace(tags={'cellType': 'IT', 'ynormRange': [0.2, 0.5]}),
+            'PV': SimpleNamespace(tags={'cellType': 'PV'}),
+            'bkg': SimpleNamespace(tags={'cellModel': 'VecStim'})}
+
+    assert ruleCost(cellParams['PT_full']) == 3 + 10
+    costs = popCosts(pops, cellParams, profile={'PV': 40})
+    assert costs == {'PT5B': 13.0, 'IT2': 3.0, 'IT5': 8.0, 'PV': 40.0, 'bkg': 1.0}  # IT5: mean of both IT rules
+
+
+def test_balancePopsCostsStoredRules(tmp_path):
+    from netpyne import sim, specs
+    from cellStore import createCells, storeCellRule
+    from loadBalance import balancePops
+
+    rule = {'conds': {'cellType': 'E'},
+            'secs': {'soma': {'geom': {'diam': 18.8, 'L': 18.8, 'nseg': 3}, 'mechs': {'hh': {'gnabar': 0.12}}}}}
+    netParams = specs.NetParams()
+    netParams.cellParams['E'] = storeCellRule(rule, str(tmp_path))
+    netParams.popParams['E'] = {'cellType': 'E', 'numCells': 4}
+    sim.initialize(simConfig=specs.SimConfig({'duration': 10, 'verbose': False}), netParams=netParams)
+    sim.net.createPops()
+    balancer = balancePops()
+    createCells()
+
+    assert balancer.costs == {'E': ruleCost(rule)}  # the stored rule, not a point cell cost
+    assert balancer.loads == [(4 * ruleCost(rule), 0)]
+    assert len(sim.net.cells) == 4
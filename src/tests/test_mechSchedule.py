@@ -0,0 +1,66 @@
+import pytest
+
+from netHelpers import createNet
+
+dropped = {'startTime': 1e20 * 500, 'endTime': 1e20 * 1000, 'cellType': 'E', 'mech': 'hh', 'property': 'gnabar',
+           'newFactor': 1.0, 'origFactor': 0.75}  # as the default cfg.modifyMechs: after the end of the sim
+halve = {'startTime': 10.0, 'endTime': 20.0, 'cellType': 'E', 'mech': 'hh', 'property': 'gnabar',
+         'newFactor': 0.5, 'origFactor': 1.0}
+
+
+def _gnabar(sim):
+    return [seg.hh.gnabar for cell in sim.net.cells for seg in cell.secs['soma']['hObj']]
+
+
+def test_scheduleAfterDroppedChange():
+    from mechSchedule import MechSchedule
+
+    sim = createNet()
+    orig = _gnabar(sim)
+    schedule = MechSchedule([dropped, halve], duration=50.0)
+    assert schedule.changes == [halve]
+    assert schedule.eventTimes() == [10.0, 20.0]
+    assert schedule.handler is not None
+
+    schedule.apply(10.0)
+    assert _gnabar(sim) == pytest.approx([0.5 * g for g in orig])
+    schedule.apply(20.0)
+    assert _gnabar(sim) == pytest.approx(orig)
+
+
+def test_scheduleEndsBeforeStarts():
+    from mechSchedule import MechSchedule
+
+    sim = createNet()
+    orig = _gnabar(sim)
+    quarter = dict(halve, startTime=20.0, endTime=30.0, newFactor=0.25)
+    schedule = MechSchedule([quarter, halve], duration=50.0)
+    assert [(t, start) for t, start, _ in schedule.events] == [(10.0, True), (20.0, False), (20.0, True), (30.0, False)]
+
+    schedule.apply(20.0)
+    assert _gnabar(sim) == pytest.approx([0.25 * g for g in orig])
+
+
+def test_noChangesWithinDuration():
+    from mechSchedule import MechSchedule
+
+    createNet()
+    schedule = MechSchedule([dropped, dict(halve, startTime=60.0, endTime=70.0)], duration=50.0)
+    assert schedule.changes == [] and schedule.handler is None
+
+    schedule = MechSchedule([dict(halve, startTime=50.0, endTime=70.0)], duration=50.0)
+    assert schedule.eventTimes() == [50.0] and schedule.handler is not None
+
+
+def test_scheduleDuringRun():
+    from mechSchedule import MechSchedule
+
+    sim = createNet(duration=50.0)
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    orig = _gnabar(sim)
+    schedule = MechSchedule([dict(halve, startTime=10.0, endTime=100.0)])  # ends after the run
+    sim.runSim()
+    assert _gnabar(sim) == pytest.approx([0.5 * g for g in orig])
+    del schedule
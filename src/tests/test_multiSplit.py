@@ -0,0 +1,164 @@
+from multiSplit import CellSplitter, partitionRule
+
+
+def _rule():
+    hh = {'hh': {'gnabar': 0.12, 'gkbar': 0.036, 'gl': 0.0003, 'el': -54.3}}
+    return {'conds': {'cellType': 'PT'},
+            'secs': {'soma': {'geom': {'diam': 20, 'L': 20}, 'mechs': hh},
+                     'axon': {'geom': {'diam': 1, 'L': 100, 'nseg': 3}, 'mechs': hh, 'spikeGenLoc': 0.5,
+                              'topol': {'parentSec': 'soma', 'parentX': 0.0, 'childX': 0.0}},
+                     'apic': {'geom': {'diam': 2, 'L': 300, 'nseg': 9}, 'mechs': {'pas': {}},
+                              'topol': {'parentSec': 'soma', 'parentX': 1.0, 'childX': 0.0}},
+                     'apic_1': {'geom': {'diam': 1, 'L': 200, 'nseg': 5}, 'mechs': {'pas': {}},
+                                'topol': {'parentSec': 'apic', 'parentX': 1.0, 'childX': 0.0}},
+                     'dend': {'geom': {'diam': 1, 'L': 200, 'nseg': 7}, 'mechs': {'pas': {}},
+                              'topol': {'parentSec': 'soma', 'parentX': 0.0, 'childX': 0.0}}}}
+
+
+def test_partitionKeepsSomaAndAxonOnPiece0():
+    part = partitionRule(_rule(), 3)
+    assert part['secs'] == [['soma', 'axon'], ['apic', 'apic_1'], ['dend']]
+    assert part['nodes'] == [0.0, 1.0]
+    assert part['costs'] == [2 + 6, 18 + 10, 14]
+
+
+def test_distributeWaitsForTheNumberOfCells():
+    splitter = CellSplitter(4, 1, {'PT': _rule()})
+    splitter.addPop('PT5B', 'PT', lambda numCells: 'fallback')
+    assert splitter.distribute('PT5B', 4, 100) == 'fallback'  # one rank per cell: not split
+    assert 'PT5B' not in splitter.parts
+
+    hostCells = splitter.distribute('PT5B', 1, 100)
+    assert len(splitter.parts['PT5B']['secs']) == 3
+    assert hostCells == {0: [], 1: [0], 2: [0], 3: [0]}
+    assert splitter.pieces == {100: 2}
+
+
+def test_splitPopsOfDensityPop(monkeypatch):
+    from netpyne import sim, specs
+    from multiSplit import splitPops
+
+    netParams = specs.NetParams()
+    netParams.sizeX, netParams.sizeY, netParams.sizeZ = 100.0, 1000.0, 100.0
+    netParams.cellParams['PT5B_full'] = _rule()
+    netParams.popParams['PT5B'] = {'cellType': 'PT', 'cellModel': 'HH_full', 'ynormRange': [0.5, 0.75],
+                                   'density': 100.0}  # 100 cells/mm3 x 0.0025 mm3: no cells
+    netParams.popParams['PT5B_dense'] = dict(netParams.popParams['PT5B'], density=800.0)  # 2 cells
+    cfg = specs.SimConfig({'duration': 10, 'verbose': False, 'multisplit': 'ranks',
+                           'multisplitParams': {'cellRules': ['PT5B_full'], 'maxPieces': 4}})
+    sim.initialize(simConfig=cfg, netParams=netParams)
+    monkeypatch.setattr(sim, 'nhosts', 4)
+    sim.net.createPops()
+    splitter = splitPops()
+    sim.net.createCells()
+
+    assert sim.net.pops['PT5B_dense'].tags['numCells'] == 2
+    assert len(splitter.parts['PT5B_dense']['secs']) == 2  # 4 ranks // 2 cells
+    assert 'PT5B' not in splitter.parts
+    # pieces of cell 0 on ranks 3, 2 and of cell 1 on ranks 1, 0 (from the last rank)
+    assert splitter.pieces == {1: 1}
+    assert [cell.gid for cell in sim.net.cells] == [1]
+
+
+def _splitNet(rule, nPieces, stims):
+    """ One cell of rule with IClamps (stims: {sec: amp}), as nPieces pieces joined with pc.multisplit if nPieces > 1 """
+    from neuron import h
+    from netpyne import sim, specs
+    from multiSplit import splitCell
+
+    netParams = specs.NetParams()
+    netParams.cellParams['PT5B_full'] = rule
+    netParams.popParams['PT5B'] = {'cellType': 'PT', 'numCells': 1}
+    for secName, amp in stims.items():
+        netParams.stimSourceParams['iclamp_' + secName] = {'type': 'IClamp', 'del': 5, 'dur': 40, 'amp': amp}
+        netParams.stimTargetParams['iclamp_' + secName] = {'source': 'iclamp_' + secName, 'sec': secName, 'loc': 0.5,
+                                                           'conds': {'pop': 'PT5B'}}
+    sim.initialize(simConfig=specs.SimConfig({'duration': 50, 'dt': 0.025, 'verbose': False}), netParams=netParams)
+    sim.net.createPops()
+    sim.net.createCells()
+    cell = sim.net.cells[0]
+
+    pieces = [cell]
+    if nPieces > 1:
+        part = partitionRule(rule, nPieces)
+        assert len(part['secs']) == nPieces
+        for piece in range(1, nPieces):  # the other pieces, as created on other ranks
+            pieces.append(type(cell)(cell.gid, cell.tags, associateGid=False))
+        for pieceCell in pieces:  # same stims on every piece (each on its own rank), dropped with their secs
+            sim.net.cells, sim.net.gid2lid = [pieceCell], {cell.gid: 0}
+            sim.net.addStims()
+        sim.cvode.cache_efficient(1)
+        for piece, pieceCell in enumerate(pieces):
+            splitCell(pieceCell, part, piece, CellSplitter.sid)
+        sim.pc.multisplit()
+        sim.net.cells, sim.net.gid2lid = [cell], {cell.gid: 0}
+    else:
+        sim.net.addStims()
+
+    soma = h.Vector().record(cell.secs['soma']['hObj'](0.5)._ref_v)
+    sim.pc.set_maxstep(10)
+    h.finitialize(-65)
+    sim.pc.psolve(50)
+    return soma.as_numpy().copy(), pieces
+
+
+def test_splitCellMatchesUnsplitCell():
+    import numpy as np
+    from netpyne import sim
+
+    rule = _rule()
+    rule['secs']['dend_1'] = {'geom': {'diam': 1.5, 'L': 150, 'nseg': 5}, 'mechs': {'pas': {}},
+                              'topol': {'parentSec': 'soma', 'parentX': 0.0, 'childX': 0.0}}
+    stims = {'soma': 0.3, 'apic_1': 0.2, 'dend': 0.1}
+    vsoma, _ = _splitNet(rule, 1, stims)
+    assert vsoma.max() > 0  # spikes
+    try:
+        for nPieces in [2, 3, 4]:
+            vsplit, _ = _splitNet(rule, nPieces, stims)
+            assert np.abs(vsplit - vsoma).max() < 1e-8, nPieces
+    finally:
+        sim.cvode.cache_efficient(0)
+
+
+def test_splitPieceKeepsItsOwnConnsAndStims(monkeypatch):
+    from netpyne import sim, specs
+    from multiSplit import splitCell, splitPops
+
+    netParams = specs.NetParams()
+    netParams.cellParams['PT5B_full'] = _rule()
+    netParams.popParams['PT5B'] = {'cellType': 'PT', 'numCells': 2}
+    netParams.synMechParams['AMPA'] = {'mod': 'Exp2Syn', 'tau1': 0.1, 'tau2': 1.0, 'e': 0}
+    for secName in ['soma', 'apic', 'dend']:  # a NetStim conn and an IClamp on each sec
+        netParams.stimSourceParams['ns_' + secName] = {'type': 'NetStim', 'rate': 10, 'noise': 0}
+        netParams.stimTargetParams['ns_' + secName] = {'source': 'ns_' + secName, 'sec': secName, 'synMech': 'AMPA',
+                                                       'weight': 0.001, 'delay': 1, 'conds': {'pop': 'PT5B'}}
+        netParams.stimSourceParams['ic_' + secName] = {'type': 'IClamp', 'del': 1, 'dur': 5, 'amp': 0.1}
+        netParams.stimTargetParams['ic_' + secName] = {'source': 'ic_' + secName, 'sec': secName, 'loc': 0.5,
+                                                       'conds': {'pop': 'PT5B'}}
+    cfg = specs.SimConfig({'duration': 10, 'verbose': False, 'multisplit': 'ranks',
+                           'multisplitParams': {'cellRules': ['PT5B_full'], 'maxPieces': 4}})
+    sim.initialize(simConfig=cfg, netParams=netParams)
+    monkeypatch.setattr(sim, 'nhosts', 4)
+    sim.net.createPops()
+    splitter = splitPops()
+    sim.net.createCells()
+    monkeypatch.setattr(sim, 'nhosts', 1)  # the cells of the other ranks do not exist here
+    sim.net.addStims()
+
+    # pieces of PT5B cell 0 on ranks 3, 2 and of cell 1 on ranks 1, 0: this rank holds piece 1 of gid 1
+    assert splitter.pieces == {1: 1}
+    cell = sim.net.cells[sim.net.gid2lid[1]]  # in gid2lid without registering the gid, so addStims found it
+    assert cell.gid == 1 and not sim.pc.gid_exists(1)
+    iclampSecs = lambda: sorted(stim['sec'] for stim in cell.stims if stim['type'] == 'IClamp')
+    assert sorted(conn['sec'] for conn in cell.conns) == iclampSecs() == ['apic', 'dend', 'soma']
+
+    part = splitter.parts['PT5B']
+    keep = set(part['secs'][1])
+    sim.cvode.cache_efficient(1)
+    try:
+        splitCell(cell, part, 1, splitter.sid)
+    finally:
+        sim.cvode.cache_efficient(0)
+    assert set(cell.secs) == keep and 'soma' not in keep
+    assert sorted(conn['sec'] for conn in cell.conns) == iclampSecs() == sorted(keep & {'apic', 'dend'})
+    assert all(conn['hObj'].syn().get_segment().sec == cell.secs[conn['sec']]['hObj'] for conn in cell.conns)
@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import netParamsCache
+
+
+def test_cacheKeyCoversHelperModules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for fileName in ['netParams.py', 'cfg.py', 'cellStore.py', 'drugTreatment.py']:
+        (tmp_path / fileName).write_text('# %s\n' % fileName)
+    cfg = SimpleNamespace(scale=1.0)
+
+    key = netParamsCache.cacheKey(cfg)
+    assert netParamsCache.cacheKey(cfg) == key
+    for fileName in ['netParams.py', 'cfg.py', 'cellStore.py', 'drugTreatment.py']:
+        (tmp_path / fileName).write_text('# %s edited\n' % fileName)
+        assert netParamsCache.cacheKey(cfg) != key, fileName
+        key = netParamsCache.cacheKey(cfg)
+
+
+def test_cacheKeyIgnoresRunFields(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    key = netParamsCache.cacheKey(SimpleNamespace(scale=1.0, duration=1000))
+    assert netParamsCache.cacheKey(SimpleNamespace(scale=1.0, duration=50)) == key
+    assert netParamsCache.cacheKey(SimpleNamespace(scale=0.5, duration=1000)) != key
+
+
+def test_readCmdLineArgs(tmp_path, monkeypatch):
+    cfgFile = tmp_path / 'batch_cfg.json'
+    cfgFile.write_text(json.dumps({'simConfig': {'duration': 123.0}}))
+    netParamsFile = tmp_path / 'batch_netParams.py'
+    netParamsFile.write_text('from netpyne import specs\nnetParams = specs.NetParams()\nnetParams.sizeX = 7.0\n')
+
+    monkeypatch.setattr(netParamsCache, 'netParamsFile', 'netParams.py')  # restored after the test
+    monkeypatch.setattr(sys, 'argv', ['init.py', 'simConfig=%s' % cfgFile, 'netParams=%s' % netParamsFile])
+    cfg, netParams = netParamsCache.readCmdLineArgs()
+
+    assert cfg.duration == 123.0
+    assert netParams.sizeX == 7.0
+    assert netParamsCache.netParamsFile == str(netParamsFile)
+    assert sys.argv[-1] == 'netParams=%s' % netParamsFile
+
+
+def test_loadNetParamsInFreshProcess(tmp_path):
+    # default cfg flags, before anything (sim.initialize, an earlier test) has set up sim.nhosts
+    (tmp_path / 'netParams.py').write_text('from netpyne import specs\nnetParams = specs.NetParams()\n'
+                                           'netParams.sizeX = 7.0\n')
+    script = '\n'.join(['import sys',
+                        'sys.path[:0] = [%r, %r]' % (str(tmp_path), os.path.dirname(netParamsCache.__file__)),
+                        'from types import SimpleNamespace',
+                        'from netParamsCache import loadNetParams',
+                        'cfg = SimpleNamespace(scale=1.0, broadcastNetParams=True, cacheNetParams=True,',
+                        '                      netParamsCacheFolder="cache")',
+                        'print("sizeX=%s" % loadNetParams(cfg).sizeX)'])
+    for cached in [False, True]:
+        result = subprocess.run([sys.executable, '-c', script], cwd=str(tmp_path), capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert 'sizeX=7.0' in result.stdout
+        assert ('Loading cached netParams' in result.stdout) == cached
+
+
+def test_cacheKeyCoversSpikeFiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'spikes.json').write_text('[[1.0, 2.0]]')
+    cfg = SimpleNamespace(scale=1.0, ratesLong={'TPO': 'spikes.json', 'TVL': [0, 2.5]})
+
+    key = netParamsCache.cacheKey(cfg)
+    (tmp_path / 'spikes.json').write_text('[[1.0, 3.0]]')  # same file name, new spikes
+    assert netParamsCache.cacheKey(cfg) != key
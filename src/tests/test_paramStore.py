@@ -0,0 +1,27 @@
+import json
+import os
+
+from paramStore import loadParams, saveCompact, storeParams
+
+
+def test_storeParams(tmp_path):
+    folder = str(tmp_path / 'store')
+    key = storeParams({'EEGain': 0.5, 'IEweights': [0.8, 1.0]}, folder)
+    assert storeParams({'EEGain': 0.5, 'IEweights': [0.8, 1.0]}, folder) == key  # shared by identical params
+    other = storeParams({'EEGain': 0.4, 'IEweights': [0.8, 1.0]}, folder)
+    assert other != key
+    assert sorted(os.listdir(folder)) == sorted([key + '.pkl.gz', other + '.pkl.gz'])  # no temp files left
+    assert loadParams(key, folder) == {'EEGain': 0.5, 'IEweights': [0.8, 1.0]}
+
+
+def test_saveCompact(tmp_path):
+    from netHelpers import createNet
+
+    sim = createNet(saveFolder=str(tmp_path), simLabel='trial0', paramStoreFolder=str(tmp_path / 'params'))
+    record = saveCompact(str(tmp_path / 'trial0_data'))
+    with open(tmp_path / 'trial0_data.json') as fileObj:
+        assert json.load(fileObj) == record
+
+    netParams = loadParams(record['netParams'], record['paramStore'])
+    assert netParams['connParams']['E->E']['weight'] == sim.net.params.connParams['E->E']['weight']
+    assert loadParams(record['simConfig'], record['paramStore'])['simLabel'] == 'trial0'
@@ -0,0 +1,20 @@
+import pytest
+
+from netHelpers import createNet
+
+
+@pytest.mark.parametrize('tranges', [None, [20, 80], [[0, 50], [50, 100]]])
+def test_reducePopRatesMatchesPopAvgRates(tranges):
+    from popRates import reducePopRates
+
+    sim = createNet(duration=100.0)
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    sim.runSim()
+    rates = reducePopRates(tranges)
+    sim.gatherData()
+    expected = sim.analysis.popAvgRates(tranges=tranges, show=False)
+    assert set(rates) == set(expected)
+    for pop, rate in expected.items():
+        assert rates[pop] == pytest.approx(rate)
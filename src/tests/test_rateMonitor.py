@@ -0,0 +1,32 @@
+import pytest
+
+from netHelpers import createNet
+
+
+def _run(tune, duration=1000.0):
+    from neuron import h
+    from rateMonitor import RateMonitor, runWithRateMonitor
+
+    sim = createNet(duration=duration)
+    sim.net.connectCells()
+    sim.net.addStims()
+    sim.setupRecording()
+    monitor = RateMonitor({'E': tune}, 1000, window=[100.0, None], minTime=150.0, interval=250.0)
+    assert monitor.checkpoints() == [250.0, 500.0, 750.0]
+    stopped = runWithRateMonitor(monitor)
+    return sim, monitor, stopped, h.t
+
+
+def test_saturatedRatesStopAtFirstCheckpoint():
+    sim, monitor, stopped, t = _run({'target': 1000, 'width': 1, 'min': 0})
+    assert stopped and monitor.stopTime == 250.0 and monitor.saturated == ['E']
+    assert t == pytest.approx(250.0)
+    assert max(sim.simData['spkt']) <= 250.0
+
+
+def test_unsaturatedRatesRunToTheEnd():
+    # after an early stop (h.stoprun), the next run is not stopped
+    _run({'target': 1000, 'width': 1, 'min': 0})
+    sim, monitor, stopped, t = _run({'target': 10, 'width': 1000, 'min': 0})
+    assert not stopped and monitor.stopTime is None
+    assert t == pytest.approx(1000.0)
@@ -0,0 +1,16 @@
+import json
+
+from trialProfile import applyMetricsProfile, metricsProfile, writeSummary
+
+
+def test_writeSummary(tmp_path):
+    from netHelpers import createNet
+
+    sim = createNet(saveFolder=str(tmp_path), simLabel='trial0', recordTraces={'V_soma': {}}, savePickle=True)
+    applyMetricsProfile(sim.cfg)
+    assert all(getattr(sim.cfg, k) == v for k, v in metricsProfile.items())
+
+    fileName = writeSummary(sim.cfg, {'E': 5.0, 'loss': 12.5, 'earlyStop': None})
+    with open(fileName) as fileObj:
+        summary = json.load(fileObj)
+    assert summary['simLabel'] == 'trial0' and summary['loss'] == 12.5 and summary['popRates'] == {'E': 5.0}
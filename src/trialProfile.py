@@ -0,0 +1,47 @@
+"""
+trialProfile.py
+
+Headless "metrics-only" profile for optimization trials.
+
+With cfg.metricsOnly, a trial only computes what the loss needs: no trace recording, no figures,
+no gather and no saveData; pop rates come from per-rank spike counts (popRates.py). Each trial
+writes one small summary record instead:
+
+    <saveFolder>/<simLabel>_summary.json   {'simLabel', 'inputs', 'loss', 'popRates', 'runTime', ...}
+
+Usage (init_batch.py, after loadNetParams so batch params are already applied):
+    if cfg.metricsOnly: applyMetricsProfile(cfg)
+    ...
+    writeSummary(cfg, trialResults(popRates))   # rank 0
+"""
+
+import json
+import os
+
+# cfg values overridden by the metrics-only profile
+metricsProfile = {'recordCells': [], 'recordTraces': {}, 'recordStim': False, 'recordTime': False, 'analysis': {},
+                  'savePickle': False, 'saveJson': False, 'saveCellSecs': False, 'saveCellConns': False,
+                  'outputProfile': 'standard', 'streamData': False, 'saveShards': False,
+                  'reducePopRates': True, 'trialGather': False}
+
+
+def applyMetricsProfile(cfg):
+    """ Set cfg to record and compute only what the loss needs """
+    for k, v in metricsProfile.items():
+        setattr(cfg, k, v)
+
+
+def writeSummary(cfg, results):
+    """ Write the summary record of a trial (rank 0) """
+    from netpyne import sim
+
+    summary = {'simLabel': cfg.simLabel, 'inputs': cfg.get_mappings() if hasattr(cfg, 'get_mappings') else {},
+               'loss': results.get('loss'),
+               'popRates': {k: v for k, v in results.items() if k in sim.net.pops},
+               'runTime': sim.timingData.get('runTime'), 'totalTime': sim.timingData.get('totalTime')}
+
+    os.makedirs(cfg.saveFolder, exist_ok=True)
+    fileName = os.path.join(cfg.saveFolder, cfg.simLabel + '_summary.json')
+    with open(fileName, 'w') as fileObj:
+        json.dump(summary, fileObj)
+    return fileName